@@ -89,6 +89,54 @@ class ApiService {
         }
     }
 
+    async streamChat(
+        question: string,
+        onToken: (text: string) => void,
+        onChart: (chart: any) => void
+    ): Promise<void> {
+        const response = await fetch(`${this.baseURL}/api/chat/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream',
+            },
+            body: JSON.stringify({ question }),
+        });
+        if (!response.ok || !response.body) throw new Error('Chat failed');
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+
+        // Server-Sent Events: frames separated by a blank line, each with event/data fields
+        const handleFrame = (frame: string) => {
+            let event = 'message';
+            const data: string[] = [];
+            for (const line of frame.split('\n')) {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data.push(line.slice(5).trim());
+            }
+            if (!data.length) return;
+            const payload = JSON.parse(data.join('\n'));
+            if (event === 'token') onToken(payload.text);
+            else if (event === 'chart') onChart(payload.chart);
+            else if (event === 'error') throw new Error(payload.message);
+        };
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary = buffer.indexOf('\n\n');
+            while (boundary !== -1) {
+                handleFrame(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                boundary = buffer.indexOf('\n\n');
+            }
+        }
+        if (buffer.trim()) handleFrame(buffer);
+    }
+
     async getInsights(range: string): Promise<any> {
         try {
             const response = await fetch(`${this.baseURL}/api/insights?range=${range}`);
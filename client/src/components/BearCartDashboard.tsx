@@ -110,15 +110,19 @@ const ChatInterface = ({ onClose }: { onClose: () => void }) => {
     setMessages(prev => [...prev, { role: 'user', text: userMsg }]);
     setLoading(true);
 
+    // Streamed answer fills in the last message as tokens arrive
+    const updateReply = (update: (msg: { role: 'user' | 'assistant', text: string, chart?: any }) => any) =>
+      setMessages(prev => [...prev.slice(0, -1), update(prev[prev.length - 1])]);
+
+    setMessages(prev => [...prev, { role: 'assistant', text: "" }]);
     try {
-      const data = await apiService.sendChat(userMsg);
-      setMessages(prev => [...prev, {
-        role: 'assistant',
-        text: data.answer,
-        chart: data.chart
-      }]);
+      await apiService.streamChat(
+        userMsg,
+        (text) => updateReply(msg => ({ ...msg, text: msg.text + text })),
+        (chart) => updateReply(msg => ({ ...msg, chart }))
+      );
     } catch (err) {
-      setMessages(prev => [...prev, { role: 'assistant', text: "Sorry, I couldn't process that request." }]);
+      updateReply(msg => ({ ...msg, text: msg.text || "Sorry, I couldn't process that request." }));
     } finally {
       setLoading(false);
     }
@@ -178,7 +182,7 @@ const ChatInterface = ({ onClose }: { onClose: () => void }) => {
 
       {/* Messages */}
       <div className="flex-1 overflow-y-auto p-4 space-y-4 bg-slate-100" ref={scrollRef}>
-        {messages.map((msg, i) => (
+        {messages.map((msg, i) => (msg.text || msg.chart) && (
           <div key={i} className={`flex ${msg.role === 'user' ? 'justify-end' : 'justify-start'}`}>
             <div className={cn(
               "max-w-[85%] p-3 rounded-2xl text-sm font-medium border-2 border-black shadow-[2px_2px_0px_#000]",
@@ -216,7 +220,7 @@ const ChatInterface = ({ onClose }: { onClose: () => void }) => {
             </div>
           </div>
         ))}
-        {loading && (
+        {loading && !messages[messages.length - 1]?.text && (
           <div className="flex justify-start">
             <div className="bg-white p-3 rounded-2xl rounded-bl-none border-2 border-black flex gap-1">
               <div className="w-2 h-2 bg-slate-400 rounded-full animate-bounce" />
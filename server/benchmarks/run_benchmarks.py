@@ -0,0 +1,236 @@
+"""
+Scaling benchmarks for the pipeline stages and the dashboard metrics.
+
+For each scale, synthetic raw data is generated (seeded), every pipeline
+stage runs in-process in dependency order, the outputs are written as Arrow
+tables, and BearCartMetrics is timed loading them and answering each
+dashboard range and KPI method (uncached). Timings are compared with the
+stored baselines: anything slower than baseline * (1 + tolerance), and by
+more than a small absolute margin, is a regression and the run exits with
+status 1.
+
+    python -m server.benchmarks.run_benchmarks --scales 0.1 1 10
+    python -m server.benchmarks.run_benchmarks --scales 0.1 1 --update-baseline
+
+Baselines are only comparable on the machine they were recorded on, so they
+carry a machine fingerprint; on a different machine the comparison is
+reported but does not fail the run unless --enforce is given (e.g. in CI,
+with baselines recorded on the CI runner or a generous --tolerance):
+
+    python -m server.benchmarks.run_benchmarks --enforce --tolerance 1.0
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from server.benchmarks.synthetic_data import generate_raw
+from server.services.pipeline_stages import PIPELINE_STAGES, PIPELINE_OUTPUTS
+from server.services.metrics import BearCartMetrics, TIME_RANGE_DAYS
+from server.utils.profile_utils import profile_call
+from server.utils.storage_utils import write_table
+
+logger = logging.getLogger(__name__)
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+
+DEFAULT_SCALES = [0.1, 1.0]
+
+# Allowed slowdown relative to the baseline, and the absolute slack below which
+# differences are treated as timer noise
+DEFAULT_TOLERANCE = 0.5
+MIN_DELTA_SECONDS = 0.05
+
+DASHBOARD_RANGES = list(TIME_RANGE_DAYS) + ['All Time']
+
+KPI_METHODS = ['traffic_metrics', 'conversion_metrics', 'revenue_metrics', 'quality_metrics', 'product_metrics']
+
+def machine_fingerprint() -> Dict[str, Any]:
+    return {
+        'platform': platform.platform(terse=True),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+    }
+
+def best_of(fn: Callable, repeat: int) -> float:
+    """Fastest of `repeat` timed calls"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def bench_pipeline(base_dir: str) -> Tuple[Dict[str, float], Dict[str, Any], Dict[str, Any]]:
+    """Run every stage in-process; returns (seconds, profile, output) per stage"""
+    outputs, seconds, profiles = {}, {}, {}
+    # PIPELINE_STAGES is listed in dependency order
+    for stage in PIPELINE_STAGES:
+        inputs = [os.path.join(base_dir, rel_path) for rel_path in stage.files] + [outputs[dep] for dep in stage.deps]
+        (outputs[stage.name], _), profile = profile_call(f'pipeline.{stage.name}', stage.fn, *inputs)
+        seconds[f'pipeline.{stage.name}'] = profile['wall_s']
+        profiles[f'pipeline.{stage.name}'] = profile
+        print(f"  ✓ {stage.name}: {profile['wall_s']:.2f}s")
+
+    processed_dir = os.path.join(base_dir, 'data', 'processed')
+    os.makedirs(processed_dir, exist_ok=True)
+    start = time.perf_counter()
+    for stage_name, part, name, _ in PIPELINE_OUTPUTS:
+        df = outputs[stage_name] if part is None else outputs[stage_name][part]
+        write_table(df, processed_dir, name, ('arrow',))
+    seconds['pipeline.write_outputs'] = time.perf_counter() - start
+    return seconds, profiles, outputs
+
+def bench_metrics(processed_dir: str, repeat: int) -> Dict[str, float]:
+    seconds = {}
+    start = time.perf_counter()
+    metrics = BearCartMetrics(data_dir=processed_dir)
+    seconds['metrics.load_data'] = time.perf_counter() - start
+
+    for time_range in DASHBOARD_RANGES:
+        # compute_dashboard_data bypasses the result cache
+        seconds[f'metrics.dashboard[{time_range}]'] = best_of(
+            lambda: metrics.compute_dashboard_data(time_range=time_range), repeat)
+    for method in KPI_METHODS:
+        seconds[f'metrics.{method}'] = best_of(getattr(metrics, method), repeat)
+    return seconds
+
+def run_scale(scale: float, seed: int, work_dir: str, repeat: int) -> Dict[str, Any]:
+    base_dir = os.path.join(work_dir, f'scale_{scale:g}')
+    raw_dir = os.path.join(base_dir, 'raw')
+    if os.path.exists(base_dir):
+        shutil.rmtree(base_dir)
+
+    print(f"\n--- Scale {scale:g} ---")
+    start = time.perf_counter()
+    rows = generate_raw(raw_dir, scale=scale, seed=seed)
+    print(f"  ✓ Generated {sum(rows.values()):,} rows in {time.perf_counter() - start:.1f}s")
+
+    seconds, profiles, outputs = bench_pipeline(base_dir)
+    seconds.update(bench_metrics(os.path.join(base_dir, 'data', 'processed'), repeat))
+    return {
+        'rows': rows,
+        'master_rows': int(len(outputs['features'])),
+        'seconds': {name: round(value, 4) for name, value in seconds.items()},
+        'peak_rss_mb': {name: profile['peak_rss_mb'] for name, profile in profiles.items()},
+    }
+
+def load_baselines(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {'machine': None, 'scales': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def compare(results: Dict[str, Any], baselines: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Benchmarks slower than their baseline beyond tolerance"""
+    regressions = []
+    for scale, result in results.items():
+        baseline = baselines['scales'].get(scale, {}).get('seconds', {})
+        for name, seconds in result['seconds'].items():
+            if name not in baseline:
+                continue
+            limit = baseline[name] * (1 + tolerance)
+            if seconds > limit and seconds - baseline[name] > MIN_DELTA_SECONDS:
+                regressions.append({'scale': scale, 'benchmark': name, 'seconds': seconds,
+                                    'baseline': baseline[name], 'ratio': round(seconds / baseline[name], 2)})
+    return regressions
+
+def print_table(results: Dict[str, Any], baselines: Dict[str, Any]) -> None:
+    for scale, result in results.items():
+        baseline = baselines['scales'].get(scale, {}).get('seconds', {})
+        print(f"\nScale {scale}: {result['rows']['website_sessions']:,} sessions, "
+              f"{result['rows']['website_pageviews']:,} pageviews, {result['rows']['orders']:,} orders")
+        for name, seconds in result['seconds'].items():
+            if name in baseline and baseline[name]:
+                print(f"  {name:<36} {seconds:>9.4f}s   baseline {baseline[name]:>9.4f}s   x{seconds / baseline[name]:.2f}")
+            else:
+                print(f"  {name:<36} {seconds:>9.4f}s   (no baseline)")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="BearCart scaling benchmarks")
+    parser.add_argument("--scales", nargs="+", type=float, default=DEFAULT_SCALES,
+                        help=f"Data volumes relative to the Maven extract (default: {DEFAULT_SCALES})")
+    parser.add_argument("--seed", type=int, default=0, help="Generator seed (default: 0)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per metrics benchmark; the fastest counts (default: 3)")
+    parser.add_argument("--work-dir", default=None, help="Where to generate data (default: a temporary directory)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file (default: server/benchmarks/baselines.json)")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Allowed slowdown before failing, as a fraction (default: {DEFAULT_TOLERANCE})")
+    parser.add_argument("--enforce", action="store_true",
+                        help="Fail on regressions even if the baseline was recorded on another machine or seed")
+    parser.add_argument("--update-baseline", action="store_true", help="Store these results as the baseline for their scales")
+    parser.add_argument("--output", default=None, help="Also write the results as JSON to this path")
+    args = parser.parse_args(argv)
+
+    # Stage logs would drown the results (the cleaner configures INFO logging on import)
+    logging.getLogger().setLevel(logging.WARNING)
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='bearcart-bench-')
+    try:
+        results = {f'{scale:g}': run_scale(scale, args.seed, work_dir, args.repeat) for scale in args.scales}
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    baselines = load_baselines(args.baseline)
+    machine = machine_fingerprint()
+    print_table(results, baselines)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'machine': machine, 'seed': args.seed, 'scales': results}, f, indent=4)
+
+    if args.update_baseline:
+        if baselines.get('machine') not in (None, machine):
+            # Timings from different machines don't mix; start over
+            baselines['scales'] = {}
+        baselines.update({
+            'machine': machine,
+            'seed': args.seed,
+            'recorded_at': datetime.now().isoformat(timespec='seconds'),
+        })
+        baselines['scales'].update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=4)
+        print(f"\n✓ Baseline updated: {args.baseline}")
+        return 0
+
+    if not baselines['scales']:
+        print(f"\n⚠ No baseline at {args.baseline}; record one with --update-baseline")
+        return 0
+
+    regressions = compare(results, baselines, args.tolerance)
+    comparable = baselines.get('machine') == machine and baselines.get('seed', args.seed) == args.seed
+    enforced = comparable or args.enforce
+    if regressions:
+        print(f"\n{'REGRESSION' if enforced else 'Slower than baseline'} "
+              f"(> {args.tolerance:.0%} over baseline):")
+        for r in regressions:
+            print(f"  ✗ scale {r['scale']} {r['benchmark']}: {r['seconds']:.4f}s vs {r['baseline']:.4f}s (x{r['ratio']})")
+    if not comparable:
+        if enforced:
+            print("\n⚠ Baseline was recorded on a different machine or seed; comparing anyway (--enforce)")
+        else:
+            print("\n⚠ Baseline was recorded on a different machine or seed; not failing. "
+                  "Re-record with --update-baseline on this machine, or pass --enforce.")
+            return 0
+    if regressions:
+        return 1
+    print("\n✓ No regressions")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
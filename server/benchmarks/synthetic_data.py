@@ -0,0 +1,296 @@
+"""
+Seeded synthetic BearCart raw data at configurable scale.
+
+Writes website_sessions, website_pageviews, orders, order_items,
+order_item_refunds and products CSVs with the same columns as the Maven
+Fuzzy Factory export in server/raw. Scale 1 is roughly the size of that
+export (~473k sessions, ~32k orders). Sessions walk the purchase funnel
+with fixed step-through rates, so conversion, basket and refund rates stay
+realistic at every scale. Data is generated and appended in blocks of
+sessions, so memory stays flat even at 100x.
+
+    python -m server.benchmarks.synthetic_data --out /tmp/bearcart --scale 10
+"""
+import os
+import argparse
+import logging
+from typing import Any, Dict
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Sessions at scale 1 (the Maven extract)
+BASE_SESSIONS = 472_871
+
+# Sessions generated per block
+BLOCK_SESSIONS = 250_000
+
+START = pd.Timestamp('2012-03-19')
+END = pd.Timestamp('2015-03-19 23:59:59')
+
+# Session volume grows linearly over the period to (1 + GROWTH)x its initial rate
+GROWTH = 3.0
+
+# Launch point as a fraction of the period, matching the real catalogue
+PRODUCTS = [
+    {'product_id': 1, 'product_name': 'The Original Mr. Fuzzy', 'url': '/the-original-mr-fuzzy',
+     'price_usd': 49.99, 'cogs_usd': 19.49, 'launch': 0.0, 'refund_rate': 0.045},
+    {'product_id': 2, 'product_name': 'The Forever Love Bear', 'url': '/the-forever-love-bear',
+     'price_usd': 59.99, 'cogs_usd': 22.49, 'launch': 0.29, 'refund_rate': 0.05},
+    {'product_id': 3, 'product_name': 'The Birthday Sugar Panda', 'url': '/the-birthday-sugar-panda',
+     'price_usd': 45.99, 'cogs_usd': 14.49, 'launch': 0.73, 'refund_rate': 0.06},
+    {'product_id': 4, 'product_name': 'The Hudson River Mini bear', 'url': '/the-hudson-river-mini-bear',
+     'price_usd': 29.99, 'cogs_usd': 9.49, 'launch': 0.81, 'refund_rate': 0.015},
+]
+
+# Probability of continuing from each funnel page to the next
+FUNNEL_PAGES = ['/products', None, '/cart', '/shipping', '/billing', '/thank-you-for-your-order']
+STEP_THROUGH = [0.55, 0.75, 0.45, 0.68, 0.80, 0.62]
+
+ENTRY_PAGES = ['/home', '/lander-1', '/lander-2', '/lander-3', '/lander-4', '/lander-5']
+
+# (utm_source, utm_campaign, utm_content, http_referer, share of sessions)
+TRAFFIC_MIX = [
+    ('gsearch', 'nonbrand', 'g_ad_1', 'https://www.gsearch.com', 0.59),
+    ('gsearch', 'brand', 'g_ad_2', 'https://www.gsearch.com', 0.08),
+    ('bsearch', 'nonbrand', 'b_ad_1', 'https://www.bsearch.com', 0.11),
+    ('bsearch', 'brand', 'b_ad_2', 'https://www.bsearch.com', 0.02),
+    ('socialbook', 'pilot', 'social_ad_1', 'https://www.socialbook.com', 0.012),
+    ('socialbook', 'desktop_targeted', 'social_ad_2', 'https://www.socialbook.com', 0.011),
+    (None, None, None, 'https://www.gsearch.com', 0.07),
+    (None, None, None, 'https://www.bsearch.com', 0.017),
+    (None, None, None, None, 0.08),
+]
+
+REPEAT_RATE = 0.16
+MOBILE_SHARE = 0.3
+CROSS_SELL_RATE = 0.24
+
+TABLES = ['website_sessions', 'website_pageviews', 'orders', 'order_items', 'order_item_refunds']
+
+def session_times(first: int, count: int, total: int, rng: np.random.Generator) -> np.ndarray:
+    """Timestamps of sessions first..first+count-1 of total, increasing with the id"""
+    # Inverse CDF of a linearly growing density on [0, 1]
+    q = (np.arange(first, first + count) + rng.random(count)) / total
+    g = GROWTH
+    t = (-1 + np.sqrt(1 + 2 * g * q * (1 + g / 2))) / g
+    seconds = np.sort(t) * (END - START).total_seconds()
+    return (START + pd.to_timedelta(seconds.astype(np.int64), unit='s')).to_numpy()
+
+def format_times(values: np.ndarray) -> np.ndarray:
+    """datetime64 -> 'YYYY-MM-DD HH:MM:SS' strings, as in the raw exports"""
+    return np.char.replace(np.datetime_as_string(values.astype('datetime64[s]'), unit='s'), 'T', ' ')
+
+def available_products(times: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """Random launched product (index into PRODUCTS) per timestamp; newer products get less traffic"""
+    position = (pd.to_datetime(times) - START) / (END - START)
+    launched = np.stack([np.asarray(position >= p['launch']) for p in PRODUCTS], axis=1)
+    weights = launched * np.array([1.0, 0.5, 0.35, 0.35])
+    cumulative = np.cumsum(weights / weights.sum(axis=1, keepdims=True), axis=1)
+    return (rng.random((len(times), 1)) > cumulative).sum(axis=1).clip(0, len(PRODUCTS) - 1)
+
+class SyntheticDataGenerator:
+    """Appends one block of sessions (and everything they cause) at a time to the raw CSVs"""
+
+    def __init__(self, out_dir: str, scale: float = 1.0, seed: int = 0, duplicate_rate: float = 0.0004):
+        self.out_dir = out_dir
+        self.total_sessions = max(int(BASE_SESSIONS * scale), 1)
+        self.rng = np.random.default_rng(seed)
+        self.duplicate_rate = duplicate_rate
+        self.next_id = {table: 1 for table in TABLES}
+        self.users = 0
+        self.counts = {table: 0 for table in TABLES}
+
+    def write(self, table: str, df: pd.DataFrame) -> None:
+        path = os.path.join(self.out_dir, f'{table}.csv')
+        df.to_csv(path, mode='a' if self.counts[table] else 'w', header=not self.counts[table], index=False)
+        self.counts[table] += len(df)
+
+    def take_ids(self, table: str, count: int) -> np.ndarray:
+        ids = np.arange(self.next_id[table], self.next_id[table] + count)
+        self.next_id[table] += count
+        return ids
+
+    def sessions_block(self, first: int, count: int) -> Dict[str, Any]:
+        rng = self.rng
+        ids = self.take_ids('website_sessions', count)
+        created = session_times(first, count, self.total_sessions, rng)
+
+        # Repeat sessions reuse an earlier visitor's id
+        is_repeat = (rng.random(count) < REPEAT_RATE) & (self.users > 0)
+        user_id = np.empty(count, dtype=np.int64)
+        n_new = int((~is_repeat).sum())
+        user_id[~is_repeat] = np.arange(self.users + 1, self.users + n_new + 1)
+        if is_repeat.any():
+            user_id[is_repeat] = rng.integers(1, self.users + 1, int(is_repeat.sum()))
+        self.users += n_new
+
+        mix = rng.choice(len(TRAFFIC_MIX), count, p=np.array([t[4] for t in TRAFFIC_MIX]) / sum(t[4] for t in TRAFFIC_MIX))
+        column = lambda i: np.array([t[i] for t in TRAFFIC_MIX], dtype=object)[mix]
+        df = pd.DataFrame({
+            'website_session_id': ids,
+            'created_at': format_times(created),
+            'user_id': user_id,
+            'is_repeat_session': is_repeat.astype(np.int64),
+            'utm_source': column(0),
+            'utm_campaign': column(1),
+            'utm_content': column(2),
+            'device_type': np.where(rng.random(count) < MOBILE_SHARE, 'mobile', 'desktop'),
+            'http_referer': column(3),
+        })
+
+        # A few rows exported twice, for the cleaner's de-duplication
+        duplicates = df.sample(frac=self.duplicate_rate, random_state=int(rng.integers(1 << 31))) if self.duplicate_rate else df.iloc[:0]
+        self.write('website_sessions', pd.concat([df, duplicates]))
+        return {'ids': ids, 'created': created, 'user_id': user_id}
+
+    def pageviews_block(self, sessions: Dict[str, Any]) -> Dict[str, Any]:
+        rng = self.rng
+        count = len(sessions['ids'])
+
+        # Funnel depth: pages reached after the entry page
+        reached = rng.random((count, len(STEP_THROUGH))) < np.array(STEP_THROUGH)
+        depth = np.cumprod(reached, axis=1).sum(axis=1)
+        product = available_products(sessions['created'], rng)
+        # Seconds between pageviews of a session
+        pace = rng.integers(20, 180, count)
+
+        views = depth + 1
+        session_index = np.repeat(np.arange(count), views)
+        position = np.arange(len(session_index)) - np.repeat(np.cumsum(views) - views, views)
+
+        urls = np.array([None] + FUNNEL_PAGES, dtype=object)[position]
+        entry = position == 0
+        urls[entry] = np.array(ENTRY_PAGES, dtype=object)[rng.integers(0, len(ENTRY_PAGES), int(entry.sum()))]
+        product_page = position == 2
+        urls[product_page] = np.array([p['url'] for p in PRODUCTS], dtype=object)[product[session_index[product_page]]]
+
+        times = sessions['created'][session_index] + (position * pace[session_index]).astype('timedelta64[s]')
+        self.write('website_pageviews', pd.DataFrame({
+            'website_pageview_id': self.take_ids('website_pageviews', len(session_index)),
+            'created_at': format_times(times),
+            'website_session_id': sessions['ids'][session_index],
+            'pageview_url': urls,
+        }))
+
+        converted = depth == len(STEP_THROUGH)
+        return {
+            'converted': converted,
+            'product': product,
+            'ordered_at': sessions['created'] + (len(STEP_THROUGH) * pace).astype('timedelta64[s]'),
+        }
+
+    def orders_block(self, sessions: Dict[str, Any], funnel: Dict[str, Any]) -> None:
+        rng = self.rng
+        converted = funnel['converted']
+        count = int(converted.sum())
+        if not count:
+            return
+        order_ids = self.take_ids('orders', count)
+        ordered_at = funnel['ordered_at'][converted]
+        primary = funnel['product'][converted]
+
+        # Cross-sell a different launched product
+        cross = available_products(ordered_at, rng)
+        has_cross = (rng.random(count) < CROSS_SELL_RATE) & (cross != primary)
+
+        price = np.array([p['price_usd'] for p in PRODUCTS])
+        cogs = np.array([p['cogs_usd'] for p in PRODUCTS])
+        self.write('orders', pd.DataFrame({
+            'order_id': order_ids,
+            'created_at': format_times(ordered_at),
+            'website_session_id': sessions['ids'][converted],
+            'user_id': sessions['user_id'][converted].astype(np.float64),
+            'primary_product_id': primary + 1,
+            'items_purchased': 1 + has_cross.astype(np.int64),
+            'price_usd': np.round(price[primary] + np.where(has_cross, price[cross], 0), 2),
+            'cogs_usd': np.round(cogs[primary] + np.where(has_cross, cogs[cross], 0), 2),
+        }))
+
+        # One row per item: the primary product, then the cross-sell
+        n_items = 1 + has_cross.astype(np.int64)
+        order_index = np.repeat(np.arange(count), n_items)
+        is_primary = np.ones(len(order_index), dtype=bool)
+        is_primary[np.cumsum(n_items)[has_cross] - 1] = False
+        product = np.where(is_primary, primary[order_index], cross[order_index])
+        item_ids = self.take_ids('order_items', len(order_index))
+        self.write('order_items', pd.DataFrame({
+            'order_item_id': item_ids,
+            'created_at': format_times(ordered_at[order_index]),
+            'order_id': order_ids[order_index],
+            'product_id': product + 1,
+            'is_primary_item': is_primary.astype(np.int64),
+            'price_usd': price[product],
+            'cogs_usd': cogs[product],
+        }))
+
+        refund_rate = np.array([p['refund_rate'] for p in PRODUCTS])
+        refunded = rng.random(len(order_index)) < refund_rate[product]
+        if refunded.any():
+            delay = rng.integers(86_400, 30 * 86_400, int(refunded.sum())).astype('timedelta64[s]')
+            self.write('order_item_refunds', pd.DataFrame({
+                'order_item_refund_id': self.take_ids('order_item_refunds', int(refunded.sum())),
+                'created_at': format_times(ordered_at[order_index][refunded] + delay),
+                'order_item_id': item_ids[refunded],
+                'order_id': order_ids[order_index][refunded],
+                'refund_amount_usd': price[product][refunded],
+            }))
+
+    def write_products(self) -> None:
+        launched = START + pd.to_timedelta([p['launch'] * (END - START).total_seconds() for p in PRODUCTS], unit='s')
+        pd.DataFrame({
+            'product_id': [p['product_id'] for p in PRODUCTS],
+            'created_at': format_times(launched.floor('h').to_numpy()),
+            'product_name': [p['product_name'] for p in PRODUCTS],
+        }).to_csv(os.path.join(self.out_dir, 'products.csv'), index=False)
+
+    def generate(self, block_sessions: int = BLOCK_SESSIONS) -> Dict[str, int]:
+        os.makedirs(self.out_dir, exist_ok=True)
+        # Tables without any rows still get a header-only file
+        for table in TABLES:
+            path = os.path.join(self.out_dir, f'{table}.csv')
+            if os.path.exists(path):
+                os.remove(path)
+
+        for first in range(0, self.total_sessions, block_sessions):
+            count = min(block_sessions, self.total_sessions - first)
+            sessions = self.sessions_block(first, count)
+            funnel = self.pageviews_block(sessions)
+            self.orders_block(sessions, funnel)
+
+        for table in TABLES:
+            if not self.counts[table]:
+                self.write_header(table)
+        self.write_products()
+        logger.info(f"  ✓ Generated {self.counts} in {self.out_dir}")
+        return dict(self.counts)
+
+    def write_header(self, table: str) -> None:
+        columns = {
+            'orders': ['order_id', 'created_at', 'website_session_id', 'user_id', 'primary_product_id',
+                       'items_purchased', 'price_usd', 'cogs_usd'],
+            'order_items': ['order_item_id', 'created_at', 'order_id', 'product_id', 'is_primary_item',
+                            'price_usd', 'cogs_usd'],
+            'order_item_refunds': ['order_item_refund_id', 'created_at', 'order_item_id', 'order_id',
+                                   'refund_amount_usd'],
+        }[table]
+        pd.DataFrame(columns=columns).to_csv(os.path.join(self.out_dir, f'{table}.csv'), index=False)
+
+def generate_raw(out_dir: str, scale: float = 1.0, seed: int = 0, block_sessions: int = BLOCK_SESSIONS,
+                 duplicate_rate: float = 0.0004) -> Dict[str, int]:
+    """Write a full set of raw CSVs to out_dir; returns rows written per table"""
+    generator = SyntheticDataGenerator(out_dir, scale=scale, seed=seed, duplicate_rate=duplicate_rate)
+    return generator.generate(block_sessions)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Generate synthetic BearCart raw data")
+    parser.add_argument("--out", required=True, help="Directory for the raw CSVs (e.g. <base>/raw)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Volume relative to the Maven extract (default: 1)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--block-sessions", type=int, default=BLOCK_SESSIONS,
+                        help=f"Sessions generated per block (default: {BLOCK_SESSIONS})")
+    args = parser.parse_args()
+    print(generate_raw(args.out, scale=args.scale, seed=args.seed, block_sessions=args.block_sessions))
@@ -1,15 +1,20 @@
 import os
-from supabase import create_client, Client
+from typing import TYPE_CHECKING
 from dotenv import load_dotenv
 
+if TYPE_CHECKING:
+    from supabase import Client
+
 
 _env_loaded = load_dotenv()
 
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_SERVICE_KEY") or os.getenv("SUPABASE_KEY")
 
-def get_supabase_client() -> Client:
+def get_supabase_client() -> "Client":
     if not SUPABASE_URL or not SUPABASE_KEY:
         raise RuntimeError("Supabase credentials are not configured. Set SUPABASE_URL and SUPABASE_SERVICE_KEY.")
+    # Imported on first use: the client library is slow to import and most processes never need it
+    from supabase import create_client
     return create_client(SUPABASE_URL, SUPABASE_KEY)
 
@@ -1,4 +1,6 @@
 import os
+import shutil
+import tempfile
 
 # Gunicorn configuration settings
 bind = "0.0.0.0:" + os.environ.get("PORT", "10000")
@@ -6,3 +8,38 @@ workers = 4
 worker_class = "uvicorn.workers.UvicornWorker"
 timeout = 120
 keepalive = 5
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'processed')
+
+# Workers write Prometheus samples here and /metrics merges them; it must be set
+# before any worker imports prometheus_client
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'bearcart-prometheus'))
+
+def on_starting(server):
+    """Shared mode (BEARCART_SHARED_DATA=1): load the datasets once in the master
+    and publish a memory-mappable snapshot that every worker attaches to."""
+    # Samples of a previous run's workers would be merged into /metrics
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+    from server.utils.shared_data import get_shared_dir, publish_snapshot, snapshot_lock
+    shared_dir = get_shared_dir()
+    if not shared_dir:
+        return
+
+    from server.services.metrics import BearCartMetrics
+    try:
+        metrics = BearCartMetrics(data_dir=DATA_DIR)
+        with snapshot_lock(shared_dir):
+            publish_snapshot(metrics, shared_dir)
+    except Exception as e:
+        server.log.warning(f"Shared dataset snapshot not published, workers load privately: {e}")
+
+def child_exit(server, worker):
+    from server.utils.telemetry import mark_worker_dead
+    mark_worker_dead(worker.pid)
+
+def on_exit(server):
+    from server.utils.shared_data import get_shared_dir, remove_snapshots
+    remove_snapshots(get_shared_dir())
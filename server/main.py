@@ -2,7 +2,7 @@ import os
 import logging
 import asyncio
 from fastapi import FastAPI, Request, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
@@ -15,13 +15,14 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-from server.routers.api import router as api_router
+from server.routers.api import router as api_router, chat_agent, datasets
+from server.utils.concurrency import shutdown_pools
+from server.utils.telemetry import PrometheusMiddleware, METRICS_CONTENT_TYPE, render_metrics
 
 from contextlib import asynccontextmanager
 
-import requests
-
 async def health_check_loop():
+    import requests
     # Wait for server startup
     await asyncio.sleep(5)
     while True:
@@ -38,13 +39,22 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("Application starting up...")
     task = asyncio.create_task(health_check_loop())
+    # Load the data in the background (see /ready), then swap in new
+    # run_pipeline outputs without restarting workers
+    reload_task = asyncio.create_task(datasets.watch())
     yield
     # Shutdown
+    shutdown_pools()
     task.cancel()
+    reload_task.cancel()
     try:
         await task
     except asyncio.CancelledError:
         logger.info("Health check task cancelled")
+    try:
+        await reload_task
+    except asyncio.CancelledError:
+        logger.info("Dataset reload task cancelled")
 
 def create_app() -> FastAPI:
     app = FastAPI(title="BearCart API", version="1.0.0", lifespan=lifespan)
@@ -59,6 +69,9 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+
+    # Outermost, so latency covers the whole middleware stack
+    app.add_middleware(PrometheusMiddleware)
     
     # Register error handlers
     @app.exception_handler(Exception)
@@ -71,7 +84,21 @@ def create_app() -> FastAPI:
     
     @app.get("/health")
     async def health():
-        return {"status": "ok"}
+        return {"status": "ok", "dataset_version": datasets.version, "dataset_loaded_at": datasets.loaded_at}
+
+    @app.get("/ready")
+    async def ready():
+        """Readiness (unlike /health): 503 until the dataset is loaded"""
+        if datasets.current is None:
+            return JSONResponse(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                content={"status": "loading" if datasets.loading else "failed", "error": datasets.last_error},
+            )
+        return {"status": "ready", "dataset_version": datasets.version, "llm_configured": chat_agent.available}
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(content=render_metrics(), media_type=METRICS_CONTENT_TYPE)
     
     # Log app startup
     logger.info("Application started successfully")
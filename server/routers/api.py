@@ -1,42 +1,83 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Header, HTTPException
 import os
 import json
-from server.services.metrics import BearCartMetrics
+import hashlib
+import threading
+from server.services.dataset_reloader import BearCartDatasetReloader
 from server.services.chat_agent import BearCartChatAgent
+from server.utils.shared_data import get_shared_dir
+from server.utils.concurrency import endpoint_limit, run_in_pool, run_in_process, single_flight, single_flight_stats
+from server.utils.cache_utils import VersionedLRUCache
+from server.utils.llm_cache import normalize_question
+from server.utils.telemetry import span
 from pydantic import BaseModel
+from typing import Optional
+from datetime import date, timedelta
 
 router = APIRouter(prefix="/api", tags=["analytics"])
 
-# Initialize metrics service (load data once)
+# Metrics service; main's lifespan loads it in the background and keeps it
+# current as run_pipeline writes new data
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, 'data', 'processed')
 
-try:
-    metrics_service = BearCartMetrics(data_dir=DATA_DIR)
-except Exception as e:
-    print(f"Error loading metrics: {e}")
-    metrics_service = None
+datasets = BearCartDatasetReloader(DATA_DIR, shared_dir=get_shared_dir())
 
 # Initialize Chat Agent
 chat_agent = BearCartChatAgent()
 
+def active_metrics():
+    """BearCartMetrics serving requests (None if loading failed); 503 during warm-up"""
+    if datasets.loading:
+        raise HTTPException(status_code=503, detail="Dataset is still loading, retry shortly",
+                            headers={"Retry-After": "5"})
+    return datasets.current
+
 class ChatRequest(BaseModel):
     question: str
 
+def resolve_date_range(start: Optional[date], end: Optional[date]):
+    """Inclusive start/end query dates -> [start, end) bounds for the metrics service"""
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    return start, (end + timedelta(days=1)) if end else None
+
+def describe_range(range: str, start: Optional[date], end: Optional[date]) -> str:
+    if not start and not end:
+        return range
+    return f"{start or 'start'} to {end or 'latest'}"
+
 @router.get("/dashboard")
-async def get_dashboard_data(range: str = "Month"):
+async def get_dashboard_data(range: str = "Month", start: Optional[date] = None, end: Optional[date] = None,
+                             sections: Optional[str] = None):
+    """Dashboard KPIs for a named range, or for custom inclusive start/end dates (YYYY-MM-DD).
+    sections: optional comma-separated subset (traffic,conversion,revenue,quality,products)"""
+    metrics_service = active_metrics()
     if not metrics_service:
         raise HTTPException(status_code=500, detail="Metrics service not initialized. Run pipeline first.")
     
+    start_date, end_date = resolve_date_range(start, end)
+    section_list = [s.strip() for s in sections.split(',') if s.strip()] if sections else None
+    try:
+        section_list = metrics_service.normalize_sections(section_list)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def compute():
+        async with endpoint_limit('dashboard'):
+            return await run_in_pool('metrics', metrics_service.get_dashboard_data, time_range=range,
+                                     start_date=start_date, end_date=end_date, sections=section_list)
+
     try:
-        data = metrics_service.get_dashboard_data(time_range=range)
-        return data
+        key = (metrics_service.dataset_version, range, start_date, end_date, tuple(section_list) if section_list else None)
+        return await single_flight('dashboard', key, compute)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/quality")
 async def get_quality_report():
     """Get data quality metrics"""
+    metrics_service = active_metrics()
     try:
         report_path = os.path.join(metrics_service.data_dir, 'quality_report.json')
         if os.path.exists(report_path):
@@ -46,60 +87,170 @@ async def get_quality_report():
     except Exception as e:
         return {"error": str(e)}
 
+@router.get("/cache")
+async def get_cache_stats():
+    """Dashboard result cache counters for the active dataset version"""
+    metrics_service = active_metrics()
+    if not metrics_service:
+        raise HTTPException(status_code=500, detail="Metrics service not initialized")
+
+    return {
+        "dataset_version": metrics_service.dataset_version,
+        "reloader": datasets.status(),
+        **metrics_service.result_cache.stats(),
+        "llm": chat_agent.cache.stats(),
+        "llm_tokens": chat_agent.token_stats(),
+        "pdf": pdf_cache.stats(),
+        "single_flight": single_flight_stats()
+    }
+
 @router.post("/chat")
 async def chat_with_data(request: ChatRequest):
     """Chat with BearCart AI using dashboard context"""
+    metrics_service = active_metrics()
     if not metrics_service:
         raise HTTPException(status_code=500, detail="Metrics service not initialized")
         
-    try:
+    async def answer():
         # Get current dashboard data context
         # We use a default 'Month' range for context, or could make it dynamic
-        context_data = metrics_service.get_dashboard_data(time_range='Month')
-        
-        # Get answer from agent
-        response = chat_agent.ask(request.question, context_data)
-        return response
+        async with endpoint_limit('chat'):
+            context_data = await run_in_pool('metrics', metrics_service.get_dashboard_data, time_range='Month')
+            
+            # Get answer from agent
+            return await run_in_pool('llm', chat_agent.ask, request.question, context_data)
+
+    try:
+        # Same question asked concurrently (e.g. a suggested prompt) -> one Gemini call
+        return await single_flight('chat', (metrics_service.dataset_version, normalize_question(request.question)), answer)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-from fastapi.responses import StreamingResponse
-from server.services.pdf_service import BearCartReport
+from fastapi.responses import Response, StreamingResponse
+
+# Rendered report bytes per ((range, start, end), dataset version)
+pdf_cache = VersionedLRUCache(maxsize=int(os.getenv("BEARCART_PDF_CACHE_SIZE", "16")))
+# Reports of a replaced dataset version can't be requested again
+datasets.on_swap.append(lambda metrics: pdf_cache.invalidate(metrics.dataset_version))
+
+def report_etag(key: tuple, version: str) -> str:
+    """Weak ETag: a report is equivalent (not byte-identical, it embeds its render time)
+    for the same range and dataset version, so it holds across workers"""
+    digest = hashlib.sha1(repr((key, version)).encode()).hexdigest()[:16]
+    return f'W/"{digest}"'
+
+def sse_event(event: str, data: dict) -> str:
+    """One Server-Sent Events frame"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@router.post("/chat/stream")
+async def chat_with_data_stream(request: ChatRequest):
+    """Chat with BearCart AI, streaming the answer as Server-Sent Events.
+    Emits `token` events with answer text, then a final `chart` event and `done`."""
+    metrics_service = active_metrics()
+    if not metrics_service:
+        raise HTTPException(status_code=500, detail="Metrics service not initialized")
+
+    async def events():
+        async with endpoint_limit('chat'):
+            try:
+                context_data = await run_in_pool('metrics', metrics_service.get_dashboard_data, time_range='Month')
+            except Exception as e:
+                yield sse_event('error', {'message': str(e)})
+                return
+
+            # Each next() blocks on the Gemini stream, so pull chunks on the llm pool
+            stream = chat_agent.ask_stream(request.question, context_data)
+            finished = object()
+            # A generator can't be closed while a pool thread is inside next()
+            stream_lock = threading.Lock()
+
+            def pull():
+                with stream_lock:
+                    return next(stream, finished)
+
+            def close():
+                with stream_lock:
+                    stream.close()
+
+            try:
+                while True:
+                    item = await run_in_pool('llm', pull)
+                    if item is finished:
+                        break
+                    yield sse_event(*item)
+            finally:
+                # Client gone or done: release the upstream connection now rather than at GC
+                await run_in_pool('llm', close)
+
+    headers = {
+        'Cache-Control': 'no-cache',
+        # Stop nginx-style proxies from buffering the stream
+        'X-Accel-Buffering': 'no',
+    }
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
 
 @router.get("/export/pdf")
-async def export_pdf(range: str = "Month"):
+async def export_pdf(range: str = "Month", start: Optional[date] = None, end: Optional[date] = None,
+                     if_none_match: Optional[str] = Header(None)):
+    metrics_service = active_metrics()
     if not metrics_service:
         raise HTTPException(status_code=500, detail="Metrics service not initialized")
     
-    try:
+    start_date, end_date = resolve_date_range(start, end)
+    label = describe_range(range, start, end)
+    key = (range, start_date, end_date)
+    version = metrics_service.dataset_version
+    etag = report_etag(key, version)
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="BearCart_Report_{label.replace(" ", "_")}.pdf"',
+        'ETag': etag,
+        'Cache-Control': 'private, no-cache',
+    }
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    async def render():
         # Get data for the requested range
-        data = metrics_service.get_dashboard_data(time_range=range)
-        
-        # Generate PDF
-        report = BearCartReport()
-        pdf_buffer = report.generate(data, time_range=range)
-        
-        headers = {
-            'Content-Disposition': f'attachment; filename="BearCart_Report_{range}.pdf"'
-        }
+        async with endpoint_limit('export_pdf'):
+            data = await run_in_pool('metrics', metrics_service.get_dashboard_data, time_range=range,
+                                     start_date=start_date, end_date=end_date)
+            
+            # Generate PDF in a separate process; reportlab holds the GIL for the whole render
+            with span('pdf.render'):
+                # reportlab is only imported once a report is requested
+                from server.services.pdf_service import render_report
+                pdf_bytes = await run_in_process('render', render_report, data, label)
+        pdf_cache.set(key, version, pdf_bytes)
+        return pdf_bytes
+
+    try:
+        pdf_bytes = pdf_cache.get(key, version)
+        if pdf_bytes is None:
+            pdf_bytes = await single_flight('export_pdf', (key, version), render)
         
-        return StreamingResponse(pdf_buffer, media_type="application/pdf", headers=headers)
+        return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/insights")
 async def get_insights(range: str = "Month"):
+    metrics_service = active_metrics()
     if not metrics_service:
         raise HTTPException(status_code=500, detail="Metrics service not initialized")
     
-    try:
+    async def generate():
         # Get context data
-        context_data = metrics_service.get_dashboard_data(time_range=range)
-        
-        # Generate insights
-        insights = chat_agent.generate_strategic_insights(context_data)
-        return insights
+        async with endpoint_limit('insights'):
+            context_data = await run_in_pool('metrics', metrics_service.get_dashboard_data, time_range=range)
+            
+            # Generate insights
+            return await run_in_pool('llm', chat_agent.generate_strategic_insights, context_data)
+
+    try:
+        return await single_flight('insights', (metrics_service.dataset_version, range), generate)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -111,12 +262,17 @@ from datetime import datetime
 @router.get("/forecast")
 async def get_forecast(periods: int = 3):
     """Generate X-month revenue forecast based on yearly history"""
+    metrics_service = active_metrics()
     if not metrics_service:
         raise HTTPException(status_code=500, detail="Metrics service not initialized")
     
     try:
         # Get 1 year of data for good trend analysis
-        data = metrics_service.get_dashboard_data(time_range='Year')
+        async def year_data():
+            async with endpoint_limit('forecast'):
+                return await run_in_pool('metrics', metrics_service.get_dashboard_data, time_range='Year')
+
+        data = await single_flight('forecast', (metrics_service.dataset_version, 'Year'), year_data)
         daily_revenue = data['revenue']['revenue_over_time']
         
         if not daily_revenue:
@@ -1,86 +1,337 @@
 import os
 import json
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 from server.services.data_cleaner import BearCartDataCleaner
 from server.services.feature_engineer import BearCartFeatureEngineer
+from server.utils.storage_utils import write_table, append_csv, read_table, require_table, find_table, ARROW_EXT, CSV_EXT
+from server.utils.schema_utils import MASTER_SCHEMA, apply_schema, log_memory_report
+from server.utils.watermark_utils import (WATERMARK_COLUMNS, PENDING_DIR, load_state, save_state, read_new_rows,
+                                         load_pending, save_pending, clear_pending)
+from server.utils.dag_utils import run_stages
+from server.utils.profile_utils import PipelineProfiler
+from server.services.pipeline_stages import PIPELINE_STAGES, PIPELINE_OUTPUTS, PIPELINE_PENDING, write_output
 
-def run():
+ESSENTIAL_FILES = ['website_sessions.csv', 'orders.csv', 'order_item_refunds.csv', 'order_items.csv',
+                   'products.csv', 'website_pageviews.csv']
+
+# Stage -> raw table whose watermark it reports
+TABLE_OF_STAGE = {
+    'sessions': 'website_sessions',
+    'pageviews': 'website_pageviews',
+    'orders': 'orders',
+    'refunds': 'order_item_refunds',
+    'items': 'order_items',
+}
+
+def output_exts(formats):
+    return [{'csv': CSV_EXT, 'arrow': ARROW_EXT}[fmt] for fmt in formats]
+
+def run(formats=('csv', 'arrow'), incremental=False, base_dir=None, workers=None, use_cache=True, profile=False,
+        trace_memory=False):
     # Paths
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+    BASE_DIR = base_dir or os.path.dirname(os.path.abspath(__file__))
     RAW_DIR = os.path.join(BASE_DIR, 'raw')
     PROCESSED_DIR = os.path.join(BASE_DIR, 'data', 'processed')
+    CLEANED_DIR = os.path.join(BASE_DIR, 'data', 'cleaned')
     
     os.makedirs(PROCESSED_DIR, exist_ok=True)
+    profiler = PipelineProfiler(enabled=profile, trace_memory=trace_memory)
+
+    if incremental:
+        state = load_state(PROCESSED_DIR)
+        if state is not None and find_table(PROCESSED_DIR, 'master_dataset'):
+            return run_incremental(RAW_DIR, PROCESSED_DIR, CLEANED_DIR, formats, state, profiler)
+        print("No previous pipeline state found; running a full rebuild")
     
-    cleaner = BearCartDataCleaner()
-    fe = BearCartFeatureEngineer()
-    
-    # 1. Load Data
-    print("--- Loading Data ---")
-    df_sessions, _ = cleaner.load_and_profile(os.path.join(RAW_DIR, 'website_sessions.csv'))
-    df_orders, _ = cleaner.load_and_profile(os.path.join(RAW_DIR, 'orders.csv'))
-    df_refunds, _ = cleaner.load_and_profile(os.path.join(RAW_DIR, 'order_item_refunds.csv'))
-    df_items, _ = cleaner.load_and_profile(os.path.join(RAW_DIR, 'order_items.csv'))
-    df_products, _ = cleaner.load_and_profile(os.path.join(RAW_DIR, 'products.csv'))
-    df_pageviews, _ = cleaner.load_and_profile(os.path.join(RAW_DIR, 'website_pageviews.csv'))
-    
-    if any(df is None for df in [df_sessions, df_orders, df_items, df_products, df_pageviews]):
-        print("CRITICAL: Missing essential data files. Exiting.")
+    # Every essential raw table must exist before anything runs
+    missing = [f for f in ESSENTIAL_FILES if not os.path.exists(os.path.join(RAW_DIR, f))]
+    if missing:
+        print(f"CRITICAL: Missing essential data files {missing}. Exiting.")
         return
 
-    # 2. Clean Data
-    print("\n--- Cleaning Data ---")
-    df_sessions_clean = cleaner.clean_sessions(df_sessions)
-    df_orders_clean = cleaner.clean_orders(df_orders, df_sessions_clean)
-    df_refunds_clean = cleaner.clean_refunds(df_refunds, df_orders_clean)
-    
-    df_products_clean = cleaner.clean_products(df_products)
-    df_items_clean = cleaner.clean_order_items(df_items, df_orders_clean, df_products_clean)
-    df_funnel_agg = cleaner.clean_pageviews(df_pageviews)
-    
-    # 3. Create Master Dataset (Sessions Level)
-    print("\n--- Creating Master Dataset ---")
-    df_master = cleaner.create_master_dataset(df_sessions_clean, df_orders_clean, df_refunds_clean, df_funnel_agg)
-    
-    # 4. Feature Engineering
-    print("\n--- Engineering Features ---")
-    # Note: FE might need updates if it used old df_items, but we pass raw items there usually. 
-    # Let's pass cleaned items if possible or just proceed. 
-    # Current signature: fe.engineer_features(df_master, df_sessions, df_orders, df_items)
-    df_master_features = fe.engineer_features(df_master, df_sessions_clean, df_orders_clean, df_items_clean)
+    # 1-4. Load, clean, build the master dataset and engineer features as a stage
+    # graph: independent stages (sessions, pageviews, products) run in parallel
+    # and stages whose inputs and code are unchanged come from the cache
+    print("--- Running Pipeline Stages ---")
+    results = run_stages(PIPELINE_STAGES, BASE_DIR, os.path.join(BASE_DIR, 'data', 'cache', 'pipeline'),
+                         max_workers=workers, use_cache=use_cache, profile=profile,
+                         trace_memory=trace_memory)
+
+    cleaning_report, marks = {}, {}
+    for stage in PIPELINE_STAGES:
+        report = results[stage.name].report
+        cleaning_report.update(report.get('cleaning_report', {}))
+        if 'watermark' in report:
+            marks[TABLE_OF_STAGE[stage.name]] = report['watermark']
+        if profile:
+            profiler.add(results[stage.name].profile or {'stage': stage.name, 'cached': True})
+    feature_report = results['features'].report['feature_report']
+    memory_report = results['features'].report['memory_report']
+    log_memory_report(memory_report)
     
-    # 5. Save Outputs
+    # 5. Save Outputs (one worker per table), skipping tables already written from the same stage output
     print("\n--- Saving Outputs ---")
+    os.makedirs(CLEANED_DIR, exist_ok=True)
+    previous = (load_state(PROCESSED_DIR) or {}).get('outputs', {})
+    outputs, writes = {}, []
+    for stage_name, part, name, cleaned_name in PIPELINE_OUTPUTS:
+        source = f"{os.path.basename(results[stage_name].path)}:{part}:{','.join(sorted(formats))}"
+        outputs[name] = source
+        cleaned_path = os.path.join(CLEANED_DIR, cleaned_name) if cleaned_name else None
+        exists = all(os.path.exists(os.path.join(PROCESSED_DIR, name + ext)) for ext in output_exts(formats)) and \
+            (cleaned_path is None or os.path.exists(cleaned_path))
+        if previous.get(name) == source and exists:
+            print(f"  ✓ {name} unchanged")
+            continue
+        writes.append((results[stage_name].path, part, PROCESSED_DIR, name, formats, cleaned_path))
+
+    # Rows whose parent isn't in the export yet; the next incremental run retries them
+    clear_pending(PROCESSED_DIR)
+    os.makedirs(os.path.join(PROCESSED_DIR, PENDING_DIR))
+    for stage_name, part, name in PIPELINE_PENDING:
+        writes.append((results[stage_name].path, part, os.path.join(PROCESSED_DIR, PENDING_DIR), name, ('arrow',)))
+
+    if writes:
+        profiler.measure('write_outputs', write_outputs, writes, workers)
+    
+    # Save reports
+    with open(os.path.join(PROCESSED_DIR, 'quality_report.json'), 'w') as f:
+        json.dump(cleaning_report, f, indent=4)
     
+    with open(os.path.join(PROCESSED_DIR, 'feature_report.json'), 'w') as f:
+        json.dump(feature_report, f, indent=4)
+
+    with open(os.path.join(PROCESSED_DIR, 'memory_report.json'), 'w') as f:
+        json.dump(memory_report, f, indent=4)
+
+    save_state(PROCESSED_DIR, marks, mode='full', outputs=outputs)
+    profiler.write(PROCESSED_DIR, mode='full')
+        
+    print(f"\nSUCCESS! Data saved to {PROCESSED_DIR}")
+    print("Cleaning Report:", json.dumps(cleaning_report, indent=2))
+    print("Feature Report:", json.dumps(feature_report, indent=2))
+
+def write_outputs(writes, workers=None):
+    """Run write_output jobs on a process pool (one worker per table)"""
+    with ProcessPoolExecutor(max_workers=workers or min(len(writes), os.cpu_count() or 1),
+                             mp_context=multiprocessing.get_context('spawn')) as pool:
+        for future in [pool.submit(write_output, *args) for args in writes]:
+            print(f"  ✓ Wrote {future.result()}")
+
+def save_outputs(PROCESSED_DIR, CLEANED_DIR, formats, df_sessions_clean, df_orders_clean, df_items_clean,
+                 df_products_clean, df_refunds_clean, df_master_features, df_sessions_added=None):
+    """Write cleaned and processed outputs. Sessions only ever gain rows, so in
+    incremental runs (df_sessions_added given) their CSVs are appended to."""
     # Cleaned Data (Submission Requirement 1)
-    CLEANED_DIR = os.path.join(BASE_DIR, 'data', 'cleaned')
     os.makedirs(CLEANED_DIR, exist_ok=True)
     
-    df_sessions_clean.to_csv(os.path.join(CLEANED_DIR, 'website_sessions_clean.csv'), index=False)
+    append_csv(df_sessions_clean, os.path.join(CLEANED_DIR, 'website_sessions_clean.csv'), df_sessions_added)
     df_orders_clean.to_csv(os.path.join(CLEANED_DIR, 'orders_clean.csv'), index=False)
     df_items_clean.to_csv(os.path.join(CLEANED_DIR, 'order_items_clean.csv'), index=False)
     df_products_clean.to_csv(os.path.join(CLEANED_DIR, 'products_clean.csv'), index=False)
     df_refunds_clean.to_csv(os.path.join(CLEANED_DIR, 'order_item_refunds_clean.csv'), index=False)
     
     # Processed Data (for Dashboard App)
-    df_sessions_clean.to_csv(os.path.join(PROCESSED_DIR, 'sessions_clean.csv'), index=False)
-    df_orders_clean.to_csv(os.path.join(PROCESSED_DIR, 'orders_clean.csv'), index=False)
-    df_items_clean.to_csv(os.path.join(PROCESSED_DIR, 'items_clean.csv'), index=False)
-    df_master_features.to_csv(os.path.join(PROCESSED_DIR, 'master_dataset.csv'), index=False)
+    # Arrow IPC copies keep dtypes and are memory-mapped by BearCartMetrics.load_data
+    write_table(df_sessions_clean, PROCESSED_DIR, 'sessions_clean', formats, appended=df_sessions_added)
+    write_table(df_orders_clean, PROCESSED_DIR, 'orders_clean', formats)
+    write_table(df_items_clean, PROCESSED_DIR, 'items_clean', formats)
+    write_table(df_master_features, PROCESSED_DIR, 'master_dataset', formats)
     # Add missing ones for app completeness
-    df_products_clean.to_csv(os.path.join(PROCESSED_DIR, 'products_clean.csv'), index=False)
-    df_refunds_clean.to_csv(os.path.join(PROCESSED_DIR, 'refunds_clean.csv'), index=False)
-    
-    # Save reports
-    with open(os.path.join(PROCESSED_DIR, 'quality_report.json'), 'w') as f:
-        json.dump(cleaner.cleaning_report, f, indent=4)
-    
-    with open(os.path.join(PROCESSED_DIR, 'feature_report.json'), 'w') as f:
-        json.dump(fe.feature_report, f, indent=4)
-        
-    print(f"\nSUCCESS! Data saved to {PROCESSED_DIR}")
-    print("Cleaning Report:", json.dumps(cleaner.cleaning_report, indent=2))
-    print("Feature Report:", json.dumps(fe.feature_report, indent=2))
+    write_table(df_products_clean, PROCESSED_DIR, 'products_clean', formats)
+    write_table(df_refunds_clean, PROCESSED_DIR, 'refunds_clean', formats)
+
+def append_new(df_old, df_new, key):
+    """Existing rows plus new rows whose key wasn't seen before"""
+    df_new = df_new[~df_new[key].isin(df_old[key])]
+    return pd.concat([df_old, df_new], ignore_index=True)
+
+def split_orphans(df, column, parent_ids):
+    """Rows of df whose parent (column value) is not among parent_ids, and the rest"""
+    if df.empty:
+        return df, df
+    orphan = ~df[column].isin(parent_ids)
+    return df[orphan], df[~orphan]
+
+def drop_retried(df_old, df_retried, key):
+    """Earlier output without the rows being retried (their re-cleaned version replaces them)"""
+    if df_retried.empty:
+        return df_old
+    return df_old[~df_old[key].isin(df_retried[key])]
+
+def run_incremental(RAW_DIR, PROCESSED_DIR, CLEANED_DIR, formats, state, profiler=None):
+    """Clean only rows appended to the raw tables since the last run and merge
+    them into the processed outputs, recomputing just the affected sessions"""
+    profiler = profiler or PipelineProfiler()
+    measure = profiler.measure
+    cleaner = BearCartDataCleaner()
+    fe = BearCartFeatureEngineer()
+
+    # 1. Load new rows past each table's high-water mark
+    print("--- Loading New Rows ---")
+    new_rows, marks = {}, {}
+    for table, column in WATERMARK_COLUMNS.items():
+        path = os.path.join(RAW_DIR, f'{table}.csv')
+        if not os.path.exists(path):
+            continue
+        new_rows[table], marks[table] = measure(f'load_{table}', read_new_rows, path, state['tables'].get(table), column)
+    # Rows held back by the last run for want of their parent are retried with the new ones
+    retried = {}
+    for table in ['orders', 'order_items', 'order_item_refunds']:
+        retried[table] = load_pending(PROCESSED_DIR, table)
+        if not retried[table].empty:
+            print(f"  ✓ Retrying {len(retried[table])} held-back {table} rows")
+            new = new_rows.get(table)
+            new_rows[table] = retried[table] if new is None or new.empty else \
+                pd.concat([retried[table], new], ignore_index=True)
+    df_funnel_retried = load_pending(PROCESSED_DIR, 'funnel_profiles')
+    empty = pd.DataFrame()
+    df_sessions = new_rows.get('website_sessions', empty)
+    df_pageviews = new_rows.get('website_pageviews', empty)
+    df_orders = new_rows.get('orders', empty)
+    df_items = new_rows.get('order_items', empty)
+    df_refunds = new_rows.get('order_item_refunds', empty)
+
+    # Held-back rows alone can't have gained their parents
+    if all(len(df) == len(retried.get(table, empty)) for table, df in new_rows.items()):
+        print("No new rows since the last run; outputs unchanged")
+        return
+
+    # Existing outputs (memory-mapped when stored as Arrow)
+    df_sessions_old = measure('load_sessions_clean', read_table, require_table(PROCESSED_DIR, 'sessions_clean'), parse_dates=['session_date'])
+    df_orders_old = measure('load_orders_clean', read_table, require_table(PROCESSED_DIR, 'orders_clean'), parse_dates=['order_date'])
+    df_refunds_old = measure('load_refunds_clean', read_table, require_table(PROCESSED_DIR, 'refunds_clean'), parse_dates=['refund_date'])
+    df_items_old = measure('load_items_clean', read_table, require_table(PROCESSED_DIR, 'items_clean'), parse_dates=['created_at'])
+    df_master_old = measure('load_master_dataset', read_table, require_table(PROCESSED_DIR, 'master_dataset'), parse_dates=['session_date', 'first_order_date'])
+    # Products are a handful of rows; always reloaded in full
+    df_products, _ = measure('load_products', cleaner.load_and_profile, os.path.join(RAW_DIR, 'products.csv'))
+
+    # 2. Clean the new rows against the full history
+    print("\n--- Cleaning New Rows ---")
+    df_sessions_new = measure('clean_sessions', cleaner.clean_sessions, df_sessions) if not df_sessions.empty else pd.DataFrame(columns=['session_id'])
+    repeats = int(df_sessions_new['session_id'].isin(df_sessions_old['session_id']).sum())
+    cleaner.cleaning_report['sessions_duplicates'] = cleaner.cleaning_report.get('sessions_duplicates', 0) + repeats
+    df_sessions_clean = append_new(df_sessions_old, df_sessions_new, 'session_id')
+    df_sessions_added = df_sessions_clean.iloc[len(df_sessions_old):]
+
+    # Child rows that arrived before their parent are held back for the next run.
+    # Orders and refunds are kept meanwhile (a full rebuild keeps orphans too) and
+    # re-cleaned against the parent once it shows up.
+    pending = {}
+    pending['orders'], _ = split_orphans(df_orders, 'website_session_id', df_sessions_clean['session_id'])
+    df_orders_old = drop_retried(df_orders_old, retried.get('orders', empty), 'order_id')
+
+    df_orders_new = measure('clean_orders', cleaner.clean_orders, df_orders, df_sessions_clean) if not df_orders.empty else pd.DataFrame(columns=['order_id', 'session_id'])
+    df_orders_clean = append_new(df_orders_old, df_orders_new, 'order_id')
+    # The high-value cut-off is a quantile over all orders
+    df_orders_clean = cleaner.flag_high_value_orders(df_orders_clean)
+
+    pending['order_item_refunds'], _ = split_orphans(df_refunds, 'order_id', df_orders_clean['order_id'])
+    df_refunds_old = drop_retried(df_refunds_old, retried.get('order_item_refunds', empty), 'order_item_refund_id')
+    df_refunds_new = measure('clean_refunds', cleaner.clean_refunds, df_refunds, df_orders_clean) if not df_refunds.empty else pd.DataFrame(columns=['order_item_refund_id', 'order_id'])
+    df_refunds_clean = append_new(df_refunds_old, df_refunds_new, 'order_item_refund_id')
+
+    df_products_clean = measure('clean_products', cleaner.clean_products, df_products)
+    pending['order_items'], df_items = split_orphans(df_items, 'order_id', df_orders_clean['order_id'])
+    df_items_new = measure('clean_order_items', cleaner.clean_order_items, df_items, df_orders_clean, df_products_clean) if not df_items.empty else pd.DataFrame(columns=['order_item_id', 'order_id'])
+    df_items_clean = append_new(df_items_old, df_items_new, 'order_item_id')
+    # New refunds can land on items from earlier runs
+    df_items_clean = cleaner.flag_refunded_items(df_items_clean, df_refunds_clean)
+
+    if not df_pageviews.empty:
+        df_funnel_new = measure('clean_pageviews', cleaner.clean_pageviews, df_pageviews)
+    else:
+        df_funnel_new = pd.DataFrame(columns=['session_id'] + cleaner.funnel_columns())
+    if not df_funnel_retried.empty:
+        df_funnel_new = cleaner.merge_funnel_profiles(df_funnel_retried, df_funnel_new)
+    pending['funnel_profiles'], df_funnel_new = split_orphans(df_funnel_new, 'session_id', df_sessions_clean['session_id'])
+
+    # 3. Rebuild master rows of sessions touched by the new rows
+    print("\n--- Updating Master Dataset ---")
+    touched_orders = pd.concat([df_refunds_new['order_id'], df_items_new['order_id']])
+    affected = pd.concat([
+        df_sessions_new['session_id'],
+        df_funnel_new['session_id'],
+        df_orders_new['session_id'],
+        df_orders_clean.loc[df_orders_clean['order_id'].isin(touched_orders), 'session_id'],
+    ]).dropna().unique()
+    affected = df_sessions_clean['session_id'][df_sessions_clean['session_id'].isin(affected)]
+    is_affected = df_master_old['session_id'].isin(affected)
+
+    # Earlier pageviews of these sessions are only kept as their funnel profile in the master
+    df_funnel = cleaner.merge_funnel_profiles(df_master_old.loc[is_affected, ['session_id'] + cleaner.funnel_columns()], df_funnel_new)
+    df_master_new = measure(
+        'create_master_dataset', cleaner.create_master_dataset,
+        df_sessions_clean[df_sessions_clean['session_id'].isin(affected)],
+        df_orders_clean, df_refunds_clean, df_funnel
+    )
+    df_master_new = measure('engineer_features', fe.engineer_features, df_master_new, df_sessions_clean, df_orders_clean, df_items_clean)
+
+    df_master = pd.concat([df_master_old[~is_affected], df_master_new], ignore_index=True)
+    df_master = df_master.sort_values('session_id', kind='stable', ignore_index=True)
+    # Product refund rates are global, so refresh the risk of every session
+    df_master = measure('add_product_risk', fe.add_product_risk, df_master, df_orders_clean, df_items_clean)[df_master_old.columns]
+    print(f"  ✓ Recomputed {len(df_master_new)} of {len(df_master)} sessions")
+
+    df_master, memory_report = measure('apply_schema', apply_schema, df_master, MASTER_SCHEMA)
+    log_memory_report(memory_report)
+
+    # 4. Save Outputs
+    print("\n--- Saving Outputs ---")
+    measure('save_outputs', save_outputs, PROCESSED_DIR, CLEANED_DIR, formats, df_sessions_clean, df_orders_clean,
+            df_items_clean, df_products_clean, df_refunds_clean, df_master, df_sessions_added)
+
+    # Cleaning counters accumulate across runs
+    report_path = os.path.join(PROCESSED_DIR, 'quality_report.json')
+    quality_report = {}
+    if os.path.exists(report_path):
+        with open(report_path, 'r') as f:
+            quality_report = json.load(f)
+    for key, value in cleaner.cleaning_report.items():
+        quality_report[key] = quality_report.get(key, 0) + value
+    with open(report_path, 'w') as f:
+        json.dump(quality_report, f, indent=4)
+
+    with open(os.path.join(PROCESSED_DIR, 'memory_report.json'), 'w') as f:
+        json.dump(memory_report, f, indent=4)
+
+    for table, df in pending.items():
+        save_pending(PROCESSED_DIR, table, df)
+    save_state(PROCESSED_DIR, {**state['tables'], **marks}, mode='incremental')
+    profiler.write(PROCESSED_DIR, mode='incremental')
+
+    print(f"\nSUCCESS! Merged new rows into {PROCESSED_DIR}")
+    print("Cleaning Report (this run):", json.dumps(cleaner.cleaning_report, indent=2))
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="BearCart data pipeline")
+    parser.add_argument(
+        "--formats", nargs="+", choices=["csv", "arrow"], default=["csv", "arrow"],
+        help="Output formats for data/processed (default: both)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Only process rows appended to the raw tables since the last run (full rebuild if there is no previous run)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Worker processes for independent pipeline stages (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="Re-run every stage instead of reusing cached outputs of unchanged stages"
+    )
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="Record per-stage wall/CPU time, peak memory and rows/bytes in and out to data/processed/pipeline_profile.json"
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true",
+        help="With --profile, also record tracemalloc peaks (slows Python-heavy stages, so wall times are inflated)"
+    )
+    args = parser.parse_args()
+    run(formats=tuple(args.formats), incremental=args.incremental, workers=args.workers, use_cache=not args.no_cache,
+        profile=args.profile, trace_memory=args.trace_memory)
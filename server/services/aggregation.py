@@ -0,0 +1,111 @@
+import logging
+from server.utils.telemetry import span
+
+logger = logging.getLogger(__name__)
+
+# Session-level dashboard sections, in payload order
+SESSION_SECTIONS = ['traffic', 'conversion', 'revenue', 'quality']
+
+class BearCartAggregator:
+    """Fused single-pass computation of the session-level dashboard sections.
+
+    Input rows carry summed measures per (day, channel, device, segment) cell,
+    as produced by BearCartRollup. The rows are grouped once by
+    (day, channel, device); totals, channel/device breakdowns and the daily
+    revenue series are all re-sums of that small frame.
+    """
+
+    KEYS = ['day', 'traffic_channel', 'device_type']
+
+    def __init__(self, funnel_steps):
+        # Funnel step name in the payload -> measure column
+        self.funnel_steps = funnel_steps
+        self.measures = ['sessions', 'conversions', 'revenue', 'refunds', 'returning', 'pageviews'] + \
+            list(funnel_steps.values())
+
+    def compute(self, rows, sections=None, unique_users=None):
+        """Sections (default: all) from rollup rows. unique_users is a callable,
+        only evaluated when the traffic section is requested."""
+        sections = [s for s in SESSION_SECTIONS if sections is None or s in sections]
+        if not sections:
+            return {}
+
+        # The single grouped pass over the window
+        with span('dashboard.rollup_scan'):
+            cells = rows.groupby(self.KEYS, observed=True, dropna=False, sort=True)[self.measures].sum()
+
+            totals = cells.sum()
+            by_channel = cells.groupby(level='traffic_channel', observed=True).sum()
+            by_channel = by_channel[by_channel['sessions'] > 0]
+
+        # Same span names as the row-level path in BearCartMetrics.compute_dashboard_data
+        result = {}
+        if 'traffic' in sections:
+            with span('dashboard.traffic'):
+                result['traffic'] = self.traffic_section(totals, by_channel, unique_users() if unique_users else 0)
+        if 'conversion' in sections:
+            with span('dashboard.conversion'):
+                by_device = cells.groupby(level='device_type', observed=True).sum()
+                by_device = by_device[by_device['sessions'] > 0]
+                result['conversion'] = self.conversion_section(totals, by_channel, by_device)
+        if 'revenue' in sections:
+            with span('dashboard.revenue'):
+                daily = cells['revenue'].groupby(level='day').sum()
+                result['revenue'] = self.revenue_section(totals, by_channel, daily)
+        if 'quality' in sections:
+            with span('dashboard.quality'):
+                result['quality'] = self.quality_section(totals, by_channel)
+        return result
+
+    def traffic_section(self, totals, by_channel, unique_users):
+        """Traffic and engagement KPIs"""
+        sessions = by_channel['sessions'].sort_values(ascending=False, kind='stable')
+        return {
+            'total_sessions': int(totals['sessions']),
+            'unique_users': int(unique_users),
+            'sessions_by_channel': {k: int(v) for k, v in sessions.items()},
+            'total_pageviews': int(totals['pageviews']),
+        }
+
+    def conversion_section(self, totals, by_channel, by_device):
+        """Conversion funnel KPIs"""
+        total_sessions = totals['sessions']
+        converted = totals['conversions']
+        return {
+            'overall_conversion_rate': float(converted / total_sessions) if total_sessions > 0 else 0,
+            'total_conversions': int(converted),
+            'conversion_by_channel': {k: float(v) for k, v in (by_channel['conversions'] / by_channel['sessions']).items()},
+            'conversion_by_device': {k: float(v) for k, v in (by_device['conversions'] / by_device['sessions']).items()},
+            'funnel_steps': {step: int(totals[col]) for step, col in self.funnel_steps.items()},
+        }
+
+    def revenue_section(self, totals, by_channel, daily):
+        """Revenue and AOV KPIs"""
+        total_sessions = totals['sessions']
+        total_revenue = totals['revenue']
+        converted = totals['conversions']
+        return {
+            'total_revenue': float(total_revenue),
+            # Non-converted sessions carry zero order value, so AOV is revenue / converted sessions
+            'average_order_value': float(total_revenue / converted) if converted > 0 else 0,
+            'revenue_per_session': float(total_revenue / total_sessions) if total_sessions > 0 else 0,
+            'revenue_by_channel': {k: float(v) for k, v in by_channel['revenue'].items()},
+            'revenue_over_time': [
+                {'session_date': day, 'total_order_value': value}
+                for day, value in zip(daily.index.strftime('%Y-%m-%d'), daily.tolist())
+            ],
+        }
+
+    def quality_section(self, totals, by_channel):
+        """Refund and customer health KPIs"""
+        total_sessions = totals['sessions']
+        converted = totals['conversions']
+        refunds = totals['refunds']
+        at_risk = by_channel['refunds']
+        at_risk = at_risk[at_risk > 0].sort_values(ascending=False, kind='stable').head(5)
+        return {
+            'overall_refund_rate': float(refunds / converted) if converted > 0 else 0,
+            'total_refunds': int(refunds),
+            'repeat_customer_rate': float(totals['returning'] / total_sessions) if total_sessions > 0 else 0,
+            'at_risk_segments': {k: int(v) for k, v in at_risk.items()},
+        }
@@ -1,22 +1,83 @@
 import json
 import logging
-from google.genai import types
-from server.utils.llm_utils import get_llm_client, LLMConfig
+import threading
+from server.utils.llm_utils import get_llm_client, get_llm_cache, llm_configured, LLMConfig
+from server.utils.llm_cache import make_cache_key
+from server.utils.context_utils import build_llm_context, estimate_tokens
+from server.utils.telemetry import SpanTimer, span, observe
 
 logger = logging.getLogger(__name__)
 
 class BearCartChatAgent:
     """AI Assistant for BearCart Dashboard using Google GenAI"""
 
-    def __init__(self):
-        self.client = get_llm_client()
-        
+    # Bump when a prompt template changes so cached answers to the old prompt are not reused
+    ASK_PROMPT_VERSION = "ask-v2"
+    ASK_STREAM_PROMPT_VERSION = "ask-stream-v2"
+    INSIGHTS_PROMPT_VERSION = "insights-v2"
+
+    # Separates the streamed markdown answer from the trailing chart JSON
+    CHART_DELIMITER = "<<<CHART>>>"
+
+    def __init__(self, cache=None, context_token_budget=None):
+        # Created on first use, so the app starts (and serves cached answers) without GEMINI_API_KEY
+        self._client = None
+        self._client_lock = threading.Lock()
+        self.cache = cache if cache is not None else get_llm_cache()
+        self.context_token_budget = context_token_budget or LLMConfig.CONTEXT_TOKEN_BUDGET
+        # Prompt kind -> {'prompts', 'context_tokens', 'prompt_tokens', 'last_prompt_tokens'}
+        self.token_counts = {}
+        self._token_lock = threading.Lock()
+
+    @property
+    def client(self):
+        """Gemini client (raises ValueError when GEMINI_API_KEY is not set)"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    self._client = get_llm_client()
+        return self._client
+
+    @property
+    def available(self) -> bool:
+        return llm_configured()
+
+    def build_context(self, context_data: dict) -> str:
+        """Compact dashboard context for a prompt, within the token budget"""
+        context_str, _ = build_llm_context(context_data, self.context_token_budget)
+        return context_str
+
+    def record_prompt(self, kind: str, prompt: str, context_str: str, usage=None) -> None:
+        """Log and accumulate token counts for one prompt sent to the model.
+        Uses the model's reported prompt tokens when available, else an estimate."""
+        context_tokens = estimate_tokens(context_str)
+        prompt_tokens = getattr(usage, 'prompt_token_count', None) or estimate_tokens(prompt)
+        logger.info(f"LLM {kind} prompt: {prompt_tokens} tokens ({context_tokens} context)")
+        with self._token_lock:
+            counts = self.token_counts.setdefault(kind, {'prompts': 0, 'context_tokens': 0, 'prompt_tokens': 0})
+            counts['prompts'] += 1
+            counts['context_tokens'] += context_tokens
+            counts['prompt_tokens'] += prompt_tokens
+            counts['last_prompt_tokens'] = prompt_tokens
+
+    def token_stats(self) -> dict:
+        with self._token_lock:
+            return {
+                'context_token_budget': self.context_token_budget,
+                **{kind: dict(counts) for kind, counts in self.token_counts.items()},
+            }
+
     def ask(self, question: str, context_data: dict) -> dict:
         """
         Ask the AI a question about the dashboard data.
         """
         
-        context_str = json.dumps(context_data, indent=2)
+        context_str = self.build_context(context_data)
+
+        cache_key = make_cache_key(LLMConfig.MODEL_NAME, self.ASK_PROMPT_VERSION, context_str, question)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         system_prompt = f"""
         You are BearCart AI, an expert e-commerce data analyst. 
@@ -47,21 +108,24 @@ class BearCartChatAgent:
         """
 
         try:
-            response = self.client.models.generate_content(
-                model=LLMConfig.MODEL_NAME,
-                contents=[
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part.from_text(text=system_prompt + "\n\nUser Question: " + question)
-                        ]
+            from google.genai import types
+            with span('llm.ask'):
+                response = self.client.models.generate_content(
+                    model=LLMConfig.MODEL_NAME,
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                types.Part.from_text(text=system_prompt + "\n\nUser Question: " + question)
+                            ]
+                        )
+                    ],
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json" 
                     )
-                ],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json" 
                 )
-            )
             
+            self.record_prompt('ask', system_prompt + question, context_str, getattr(response, 'usage_metadata', None))
             content = response.text.strip()
             
             # Additional safety cleanup if defaults fail
@@ -70,7 +134,9 @@ class BearCartChatAgent:
             if content.endswith("```"):
                 content = content[:-3]
             
-            return json.loads(content)
+            result = json.loads(content)
+            self.cache.set(cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"GenAI Error: {e}")
@@ -79,11 +145,155 @@ class BearCartChatAgent:
                 "chart": None
             }
 
+    def ask_stream(self, question: str, context_data: dict):
+        """
+        Streaming variant of ask(). Yields (event, data) pairs:
+        ("token", {"text": ...}) as the answer is generated, then
+        ("chart", {"chart": {...} | None}) and finally ("done", {}).
+        Failures are reported as ("error", {"message": ...}).
+        """
+        context_str = self.build_context(context_data)
+
+        cache_key = make_cache_key(LLMConfig.MODEL_NAME, self.ASK_STREAM_PROMPT_VERSION, context_str, question)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            yield "token", {"text": cached["answer"]}
+            yield "chart", {"chart": cached.get("chart")}
+            yield "done", {}
+            return
+
+        # Plain markdown first so it can be forwarded as it arrives; JSON only for the chart
+        system_prompt = f"""
+        You are BearCart AI, an expert e-commerce data analyst. 
+        Your goal is to help the user understand their business performance based on the provided data.
+        
+        DATA CONTEXT:
+        {context_str}
+        
+        INSTRUCTIONS:
+        1. Answer the user's question using ONLY the provided data.
+        2. If the data describes a specific metric (e.g., revenue, conversion), cite the exact numbers.
+        3. Be concise, professional, and insightful.
+        4. If the user asks for a visualization or if a chart would clearly help, provide a JSON description of the chart in a specific format.
+        
+        RESPONSE FORMAT:
+        First write your answer in markdown. Then, on its own line, write {self.CHART_DELIMITER}
+        followed by either null or a JSON chart object with this structure:
+        {{
+            "type": "bar" | "line" | "pie",
+            "title": "Chart Title",
+            "labels": ["Label1", "Label2"],
+            "data": [10, 20]
+        }}
+        """
+
+        answer_parts = []
+        chart_text = ""
+        pending = ""
+        in_chart = False
+        # Text that could be the start of a delimiter split across chunks is held back
+        holdback = len(self.CHART_DELIMITER) - 1
+
+        # Only time spent waiting on Gemini counts, not the consumer reading between chunks
+        upstream = SpanTimer('llm.ask_stream')
+        stream = None
+        try:
+            from google.genai import types
+            with upstream.time():
+                stream = self.client.models.generate_content_stream(
+                    model=LLMConfig.MODEL_NAME,
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                types.Part.from_text(text=system_prompt + "\n\nUser Question: " + question)
+                            ]
+                        )
+                    ]
+                )
+                stream = iter(stream)
+
+            usage = None
+            first_token = True
+            while True:
+                with upstream.time():
+                    chunk = next(stream, None)
+                if first_token:
+                    observe('llm.ask_stream.first_token', upstream.seconds)
+                    first_token = False
+                if chunk is None:
+                    break
+                # The final chunk carries the usage totals
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                text = chunk.text or ""
+                if in_chart:
+                    chart_text += text
+                    continue
+
+                pending += text
+                idx = pending.find(self.CHART_DELIMITER)
+                if idx >= 0:
+                    emit, chart_text, pending = pending[:idx], pending[idx + len(self.CHART_DELIMITER):], ""
+                    in_chart = True
+                elif len(pending) > holdback:
+                    emit, pending = pending[:-holdback], pending[-holdback:]
+                else:
+                    emit = ""
+
+                if emit:
+                    answer_parts.append(emit)
+                    yield "token", {"text": emit}
+
+            if pending:
+                answer_parts.append(pending)
+                yield "token", {"text": pending}
+
+            self.record_prompt('ask_stream', system_prompt + question, context_str, usage)
+
+        except Exception as e:
+            logger.error(f"GenAI Stream Error: {e}")
+            yield "error", {"message": f"I'm sorry, I encountered an error: {str(e)}"}
+            return
+        finally:
+            upstream.record()
+            # Release the upstream HTTP stream now, also when the caller stops early
+            close = getattr(stream, 'close', None)
+            if close is not None:
+                close()
+
+        chart = self._parse_chart(chart_text)
+        yield "chart", {"chart": chart}
+        yield "done", {}
+
+        self.cache.set(cache_key, {"answer": "".join(answer_parts).strip(), "chart": chart})
+
+    def _parse_chart(self, chart_text: str):
+        """Chart JSON from the tail of a streamed answer (None if absent or malformed)"""
+        content = chart_text.strip()
+        if content.startswith("```json"):
+            content = content[7:]
+        if content.endswith("```"):
+            content = content[:-3]
+        content = content.strip()
+        if not content or content == "null":
+            return None
+        try:
+            chart = json.loads(content)
+        except json.JSONDecodeError:
+            logger.warning("Streamed chart JSON could not be parsed; dropping chart")
+            return None
+        return chart if isinstance(chart, dict) else None
+
     def generate_strategic_insights(self, context_data: dict) -> dict:
         """
         Generate high-level strategic insights based on the data.
         """
-        context_str = json.dumps(context_data, indent=2)
+        context_str = self.build_context(context_data)
+
+        cache_key = make_cache_key(LLMConfig.MODEL_NAME, self.INSIGHTS_PROMPT_VERSION, context_str)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         system_prompt = f"""
         You are BearCart Strategist, a C-level e-commerce advisor.
@@ -112,28 +322,33 @@ class BearCartChatAgent:
         """
 
         try:
-            response = self.client.models.generate_content(
-                model=LLMConfig.MODEL_NAME,
-                contents=[
-                    types.Content(
-                        role="user",
-                        parts=[
-                            types.Part.from_text(text=system_prompt)
-                        ]
+            from google.genai import types
+            with span('llm.insights'):
+                response = self.client.models.generate_content(
+                    model=LLMConfig.MODEL_NAME,
+                    contents=[
+                        types.Content(
+                            role="user",
+                            parts=[
+                                types.Part.from_text(text=system_prompt)
+                            ]
+                        )
+                    ],
+                    config=types.GenerateContentConfig(
+                        response_mime_type="application/json" 
                     )
-                ],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json" 
                 )
-            )
             
+            self.record_prompt('insights', system_prompt, context_str, getattr(response, 'usage_metadata', None))
             content = response.text.strip()
             if content.startswith("```json"):
                 content = content[7:]
             if content.endswith("```"):
                 content = content[:-3]
             
-            return json.loads(content)
+            result = json.loads(content)
+            self.cache.set(cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"GenAI Insights Error: {e}")
@@ -4,6 +4,9 @@ from datetime import datetime
 import logging
 import os
 
+from server.utils.rule_utils import load_funnel_rules, classify_urls, rule_steps
+from server.utils.raw_schema_utils import read_raw, read_raw_chunks, ensure_datetime, ensure_numeric
+
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -11,16 +14,18 @@ logger = logging.getLogger(__name__)
 class BearCartDataCleaner:
     """Production-grade data cleaning for BearCart hackathon"""
     
-    def __init__(self):
+    def __init__(self, funnel_rules=None):
         self.cleaning_report = {}
+        # URL -> funnel step rules (JSON file in $BEARCART_FUNNEL_RULES, else built-in)
+        self.funnel_rules = funnel_rules or load_funnel_rules()
         
     def load_and_profile(self, filepath):
-        """Load data and create initial profile"""
+        """Load data (typed per its raw schema) and create initial profile"""
         if not os.path.exists(filepath):
              logger.error(f"File not found: {filepath}")
              return None, {}
 
-        df = pd.read_csv(filepath)
+        df = read_raw(filepath)
         profile = {
             'rows_initial': len(df),
             'columns': len(df.columns),
@@ -47,7 +52,7 @@ class BearCartDataCleaner:
         logger.info(f"  ✓ Removed {duplicates} duplicate sessions")
         
         # Fix date columns
-        df_sessions['session_date'] = pd.to_datetime(df_sessions['session_date'], errors='coerce')
+        df_sessions['session_date'] = ensure_datetime(df_sessions['session_date'], errors='coerce')
         
         # Handle traffic source nulls
         if 'traffic_source' in df_sessions.columns:
@@ -62,7 +67,7 @@ class BearCartDataCleaner:
         # For now, I'll skip duration-based bot filtering if column missing.
         
         if 'session_duration' in df_sessions.columns:
-             df_sessions['session_duration'] = pd.to_numeric(df_sessions['session_duration'], errors='coerce')
+             df_sessions['session_duration'] = ensure_numeric(df_sessions['session_duration'])
              bot_mask = (df_sessions['session_duration'] < 1) | (df_sessions['session_duration'] > 28800)
              bots_removed = bot_mask.sum()
              df_sessions = df_sessions[~bot_mask]
@@ -90,11 +95,11 @@ class BearCartDataCleaner:
         df_orders = df_orders[df_orders['order_id'].notna()]
         
         # Fix dates
-        df_orders['order_date'] = pd.to_datetime(df_orders['order_date'], errors='coerce')
+        df_orders['order_date'] = ensure_datetime(df_orders['order_date'], errors='coerce')
         
         # Ensure session_date is datetime
         if 'session_date' in df_sessions.columns:
-             df_sessions['session_date'] = pd.to_datetime(df_sessions['session_date'])
+             df_sessions['session_date'] = ensure_datetime(df_sessions['session_date'])
         
              # Validate order_date >= session_date (merge required)
              df_merged = df_orders.merge(
@@ -117,7 +122,7 @@ class BearCartDataCleaner:
              invalid_dates = 0
 
         # Clean order_value
-        df_orders['order_value'] = pd.to_numeric(df_orders['order_value'], errors='coerce')
+        df_orders['order_value'] = ensure_numeric(df_orders['order_value'])
         
         # Remove negative orders
         negative_orders = (df_orders['order_value'] < 0).sum()
@@ -126,12 +131,17 @@ class BearCartDataCleaner:
         
         # Create features
         df_orders['order_value_log'] = np.log1p(df_orders['order_value'])
-        df_orders['high_value_order'] = (df_orders['order_value'] > 
-                                         df_orders['order_value'].quantile(0.75)).astype(int)
+        df_orders = self.flag_high_value_orders(df_orders)
         
         self.cleaning_report['orders_removed_date'] = int(invalid_dates)
         self.cleaning_report['orders_removed_negative'] = int(negative_orders)
         return df_orders
+
+    def flag_high_value_orders(self, df_orders):
+        """Top-quartile order flag (relative to every order passed in)"""
+        df_orders['high_value_order'] = (df_orders['order_value'] > 
+                                         df_orders['order_value'].quantile(0.75)).astype(int)
+        return df_orders
     
     def clean_refunds(self, df_refunds, df_orders):
         """Clean refunds and validate logic"""
@@ -143,10 +153,10 @@ class BearCartDataCleaner:
         })
 
         # Validate refund_date >= order_date
-        df_refunds['refund_date'] = pd.to_datetime(df_refunds['refund_date'])
+        df_refunds['refund_date'] = ensure_datetime(df_refunds['refund_date'])
         
         if 'order_date' in df_orders.columns:
-            df_orders['order_date'] = pd.to_datetime(df_orders['order_date'])
+            df_orders['order_date'] = ensure_datetime(df_orders['order_date'])
             
             df_merged = df_refunds.merge(
                 df_orders[['order_id', 'order_date']], 
@@ -176,20 +186,21 @@ class BearCartDataCleaner:
         })
         
         # Ensure ID format
-        df_products['product_id'] = pd.to_numeric(df_products['product_id'], errors='coerce')
+        df_products['product_id'] = ensure_numeric(df_products['product_id'])
         df_products = df_products.dropna(subset=['product_id'])
         
         # Log count
         logger.info(f"  ✓ Processed {len(df_products)} products")
         return df_products
 
-    def clean_order_items(self, df_items, df_orders, df_products):
-        """Clean order items and enrich with product details"""
+    def clean_order_items(self, df_items, df_orders, df_products, df_refunds=None):
+        """Clean order items and enrich with product details (and refund flags if refunds given)"""
         logger.info("🔍 Cleaning order items...")
         
-        # Basic Type Conversion
-        df_items['price_usd'] = pd.to_numeric(df_items['price_usd'], errors='coerce').fillna(0)
-        df_items['cogs_usd'] = pd.to_numeric(df_items['cogs_usd'], errors='coerce').fillna(0)
+        # Basic Type Conversion (no-ops when the raw schema already typed them)
+        df_items['created_at'] = ensure_datetime(df_items['created_at'], errors='coerce')
+        df_items['price_usd'] = ensure_numeric(df_items['price_usd']).fillna(0)
+        df_items['cogs_usd'] = ensure_numeric(df_items['cogs_usd']).fillna(0)
         
         # Calculate Margin
         df_items['margin_usd'] = df_items['price_usd'] - df_items['cogs_usd']
@@ -206,9 +217,18 @@ class BearCartDataCleaner:
         
         if removed > 0:
             logger.info(f"  ✓ Removed {removed} orphan items (no matching order)")
+
+        # Item-level refund flag, so product metrics don't have to join refunds per request
+        if df_refunds is not None:
+            df_items = self.flag_refunded_items(df_items, df_refunds)
             
         return df_items
 
+    def flag_refunded_items(self, df_items, df_refunds):
+        """Mark items that have a refund row"""
+        df_items['is_refunded'] = df_items['order_item_id'].isin(df_refunds['order_item_id']).astype(int)
+        return df_items
+
     def clean_pageviews(self, df_pageviews):
         """Clean pageviews and pivot to session-level funnel flags"""
         logger.info("🔍 Cleaning pageviews...")
@@ -216,38 +236,84 @@ class BearCartDataCleaner:
         # Drop nulls
         df_pageviews = df_pageviews.dropna(subset=['website_session_id', 'pageview_url'])
         
-        # Identify Key Pages
-        # Simple string matching for now based on typical urls
-        # URLs from head: /home, /products, /the-original-mr-fuzzy, /cart, /shipping, /billing, /thank-you-for-your-order
-        
-        df_pageviews['is_home'] = df_pageviews['pageview_url'].apply(lambda x: 1 if x == '/home' else 0)
-        df_pageviews['is_products'] = df_pageviews['pageview_url'].apply(lambda x: 1 if '/products' in str(x) else 0)
-        df_pageviews['is_product_page'] = df_pageviews['pageview_url'].apply(lambda x: 1 if x not in ['/home', '/products', '/cart', '/shipping', '/billing', '/thank-you-for-your-order'] and '/products' not in str(x) else 0) # Rough logic for specific product pages if URL structure varies, but let's be specific for 'the-original-mr-fuzzy'
-        
-        # Better: Specific mapping if consistent
-        df_pageviews['step_home'] = (df_pageviews['pageview_url'] == '/home').astype(int)
-        df_pageviews['step_product'] = (df_pageviews['pageview_url'].str.contains('/the-original-mr-fuzzy') | df_pageviews['pageview_url'].str.contains('/products')).astype(int) # Treating generic products page as step? Or just specific items? Let's generic products list + item page as "Product Browsing"
-        df_pageviews['step_cart'] = (df_pageviews['pageview_url'] == '/cart').astype(int)
-        df_pageviews['step_shipping'] = (df_pageviews['pageview_url'] == '/shipping').astype(int)
-        df_pageviews['step_billing'] = (df_pageviews['pageview_url'] == '/billing').astype(int)
-        df_pageviews['step_thankyou'] = (df_pageviews['pageview_url'] == '/thank-you-for-your-order').astype(int)
+        # Classify each distinct URL once and broadcast the step flags back to the rows
+        df_steps = pd.DataFrame({
+            'website_session_id': df_pageviews['website_session_id'].to_numpy(),
+            'website_pageview_id': df_pageviews['website_pageview_id'].to_numpy(),
+            **self.funnel_step_flags(df_pageviews['pageview_url']),
+        })
         
         # Aggregate to Session
-        df_funnel = df_pageviews.groupby('website_session_id').agg({
-            'website_pageview_id': 'count', # Total views
-            'step_home': 'max',
-            'step_product': 'max',
-            'step_cart': 'max',
-            'step_shipping': 'max',
-            'step_billing': 'max',
-            'step_thankyou': 'max'
-        }).reset_index()
+        aggregations = {'website_pageview_id': 'count', **{step: 'max' for step in rule_steps(self.funnel_rules)}}
+        df_funnel = df_steps.groupby('website_session_id').agg(aggregations).astype(np.int64).reset_index()
         
         df_funnel = df_funnel.rename(columns={'website_pageview_id': 'total_pageviews', 'website_session_id': 'session_id'})
         
         logger.info(f"  ✓ Processed {len(df_funnel)} session funnel profiles")
         return df_funnel
 
+    def funnel_columns(self):
+        """Session funnel profile columns: pageview count plus one flag per rule step"""
+        return ['total_pageviews'] + rule_steps(self.funnel_rules)
+
+    def funnel_step_flags(self, urls):
+        """Funnel step -> int8 0/1 flags over a Series of pageview URLs"""
+        return classify_urls(urls, self.funnel_rules)
+
+    def clean_pageviews_chunked(self, filepath, chunksize=500_000):
+        """Streaming clean_pageviews: reads the CSV in chunks and folds each one
+        into running per-session count/max aggregates, so memory is bounded by
+        the number of sessions rather than pageviews. Returns the same session
+        funnel profiles plus a load profile (rows read, max pageview id)."""
+        logger.info("🔍 Cleaning pageviews (streaming)...")
+        if not os.path.exists(filepath):
+            logger.error(f"File not found: {filepath}")
+            return None, {}
+
+        columns = ['website_pageview_id', 'website_session_id', 'pageview_url']
+        aggregations = {'total_pageviews': 'sum', **{step: 'max' for step in rule_steps(self.funnel_rules)}}
+        partials, partial_rows = [], 0
+        profile = {'rows_initial': 0, 'max_pageview_id': None}
+
+        for chunk in read_raw_chunks(filepath, chunksize, columns=columns, table='website_pageviews'):
+            profile['rows_initial'] += len(chunk)
+            chunk_max = chunk['website_pageview_id'].max()
+            if pd.notna(chunk_max) and (profile['max_pageview_id'] is None or chunk_max > profile['max_pageview_id']):
+                profile['max_pageview_id'] = int(chunk_max)
+
+            chunk = chunk.dropna(subset=['website_session_id', 'pageview_url'])
+            df_chunk = pd.DataFrame({
+                'session_id': chunk['website_session_id'].astype(np.int64).to_numpy(),
+                'total_pageviews': chunk['website_pageview_id'].notna().astype(np.int64).to_numpy(),
+                **self.funnel_step_flags(chunk['pageview_url']),
+            })
+            partials.append(df_chunk.groupby('session_id').agg(aggregations))
+            partial_rows += len(partials[-1])
+
+            # Sessions span chunk boundaries; fold partials once they outgrow a chunk
+            if partial_rows > chunksize and len(partials) > 1:
+                partials = [pd.concat(partials).groupby(level=0).agg(aggregations)]
+                partial_rows = len(partials[0])
+
+        if partials:
+            df_funnel = pd.concat(partials).groupby(level=0).agg(aggregations)
+        else:
+            df_funnel = pd.DataFrame(columns=list(aggregations)).rename_axis('session_id')
+        df_funnel = df_funnel.astype(int).reset_index()
+
+        logger.info(f"Loaded {filepath}: {profile['rows_initial']} rows in chunks of {chunksize}")
+        logger.info(f"  ✓ Processed {len(df_funnel)} session funnel profiles")
+        return df_funnel, profile
+
+    def merge_funnel_profiles(self, df_funnel_old, df_funnel_new):
+        """Combine funnel profiles of the same sessions from separate pageview batches"""
+        df_funnel = pd.concat([df_funnel_old, df_funnel_new], ignore_index=True)
+        df_funnel = df_funnel.groupby('session_id').agg({
+            'total_pageviews': 'sum',
+            **{step: 'max' for step in rule_steps(self.funnel_rules)},
+        }).reset_index()
+        return df_funnel
+
     def create_master_dataset(self, df_sessions, df_orders, df_refunds, df_pageviews_agg=None):
         """Create unified master table for analysis
            args:
@@ -280,7 +346,7 @@ class BearCartDataCleaner:
         if df_pageviews_agg is not None:
             df_master = df_master.merge(df_pageviews_agg, on='session_id', how='left')
             # Fill funnel steps with 0 for missing (means no pageviews recorded? unlikely if clean, but safest)
-            funnel_cols = ['total_pageviews', 'step_home', 'step_product', 'step_cart', 'step_shipping', 'step_billing', 'step_thankyou']
+            funnel_cols = self.funnel_columns()
             df_master[funnel_cols] = df_master[funnel_cols].fillna(0).astype(int)
         
         # Refunds join
@@ -0,0 +1,168 @@
+"""
+Hot reload of the processed datasets.
+
+BearCartDatasetReloader owns the BearCartMetrics instance the API serves. A
+background task polls the dataset version (fingerprint of the processed
+files); when run_pipeline has written a new one, a fresh BearCartMetrics is
+loaded on a worker thread while the current one keeps serving, then swapped
+in with a single reference assignment. Requests that started on the old
+instance finish on it; it is freed once they are done.
+
+In shared mode the first worker to reload a version publishes its snapshot;
+the others wait on the snapshot lock and attach to it, so memory stays
+shared across reloads.
+
+The first load also runs in the background (warm_up), so workers accept
+connections right away; /ready reports when data is being served.
+"""
+import os
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional
+
+from server.utils.cache_utils import get_dataset_version
+
+if TYPE_CHECKING:
+    from server.services.metrics import BearCartMetrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between version checks (BEARCART_RELOAD_INTERVAL; 0 disables reloading)
+DEFAULT_RELOAD_INTERVAL = 30
+
+def get_reload_interval() -> float:
+    try:
+        return max(0.0, float(os.getenv("BEARCART_RELOAD_INTERVAL", DEFAULT_RELOAD_INTERVAL)))
+    except ValueError:
+        return DEFAULT_RELOAD_INTERVAL
+
+class BearCartDatasetReloader:
+    """Serves one BearCartMetrics at a time and swaps in new dataset versions"""
+
+    def __init__(self, data_dir: str, shared_dir: Optional[str] = None, cache_size: int = 32):
+        self.data_dir = data_dir
+        self.shared_dir = shared_dir
+        self.cache_size = cache_size
+        self.current: Optional["BearCartMetrics"] = None
+        # True until the first load attempt has finished
+        self.loading = True
+        self.loaded_at: Optional[str] = None
+        self.reloads = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+        # Called with the new instance after each swap (to drop caches derived from the old data)
+        self.on_swap: List[Callable[["BearCartMetrics"], None]] = []
+        # Version seen on the previous check but not loaded yet
+        self._pending_version: Optional[str] = None
+        self._reload_lock = threading.Lock()
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.current.dataset_version if self.current is not None else None
+
+    def load(self) -> "BearCartMetrics":
+        """Load the current data directory and make it active"""
+        # pandas and pyarrow come in with the metrics service; keep them off the import path
+        from server.services.metrics import BearCartMetrics
+        with self._reload_lock:
+            start = time.perf_counter()
+            if self.shared_dir:
+                metrics = self._load_shared()
+            else:
+                metrics = BearCartMetrics(data_dir=self.data_dir, cache_size=self.cache_size)
+            self._swap(metrics)
+            logger.info(f"  ✓ Dataset {metrics.dataset_version} loaded in {time.perf_counter() - start:.2f}s")
+            return metrics
+
+    def _load_shared(self) -> "BearCartMetrics":
+        """Attach to the snapshot of the current version, publishing it first if no worker has"""
+        from server.services.metrics import BearCartMetrics
+        from server.utils.shared_data import find_snapshot, publish_snapshot, snapshot_lock
+
+        version = get_dataset_version(self.data_dir)
+        with snapshot_lock(self.shared_dir):
+            if not find_snapshot(self.shared_dir, version):
+                logger.info(f"Publishing shared dataset snapshot {version}")
+                publish_snapshot(BearCartMetrics(data_dir=self.data_dir), self.shared_dir)
+        # Shared: other workers attach concurrently, publishers (and their pruning) wait
+        with snapshot_lock(self.shared_dir, shared=True):
+            return BearCartMetrics(data_dir=self.data_dir, cache_size=self.cache_size, shared_dir=self.shared_dir)
+
+    def check(self) -> bool:
+        """Reload if a new dataset version has settled; True when one was swapped in"""
+        version = get_dataset_version(self.data_dir)
+        if version == self.version:
+            self._pending_version = None
+            return False
+        # A pipeline run rewrites its outputs one by one; wait until the
+        # fingerprint holds still for a full interval before loading
+        if version != self._pending_version:
+            self._pending_version = version
+            return False
+
+        try:
+            metrics = self.load()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.warning(f"⚠ Dataset reload failed, still serving {self.version}: {e}")
+            return False
+
+        if metrics.dataset_version != version:
+            # Files changed while loading; the next checks pick up the final version
+            logger.info(f"Dataset changed during reload ({version} -> {metrics.dataset_version})")
+        self._pending_version = None
+        return True
+
+    def _swap(self, metrics: "BearCartMetrics") -> None:
+        previous = self.version
+        # Atomic: readers see either the old or the new instance, never a mix
+        self.current = metrics
+        self.loading = False
+        self.loaded_at = datetime.now().isoformat(timespec='seconds')
+        self.last_error = None
+        if previous is not None:
+            self.reloads += 1
+            logger.info(f"  ✓ Swapped dataset {previous} -> {metrics.dataset_version}")
+        for callback in self.on_swap:
+            try:
+                callback(metrics)
+            except Exception as e:
+                logger.warning(f"⚠ Dataset swap callback failed: {e}")
+
+    async def warm_up(self) -> None:
+        """Initial load, off the event loop"""
+        try:
+            await asyncio.to_thread(self.load)
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            logger.error(f"Error loading metrics: {e}")
+        finally:
+            self.loading = False
+
+    async def watch(self, interval: Optional[float] = None) -> None:
+        """Warm up, then poll for new dataset versions until cancelled"""
+        await self.warm_up()
+        interval = get_reload_interval() if interval is None else interval
+        if not interval:
+            return
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.check)
+            except Exception as e:
+                logger.warning(f"⚠ Dataset version check failed: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "loading": self.loading,
+            "dataset_version": self.version,
+            "loaded_at": self.loaded_at,
+            "reloads": self.reloads,
+            "reload_failures": self.failures,
+            "last_reload_error": self.last_error,
+        }
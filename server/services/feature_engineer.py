@@ -3,13 +3,17 @@ import numpy as np
 import logging
 import os
 
+from server.utils.rule_utils import load_channel_rules, classify_channels
+
 logger = logging.getLogger(__name__)
 
 class BearCartFeatureEngineer:
     """Feature engineering for BearCart"""
     
-    def __init__(self):
+    def __init__(self, channel_rules=None):
         self.feature_report = {}
+        # (source, campaign) -> channel rules (JSON file in $BEARCART_CHANNEL_RULES, else built-in)
+        self.channel_rules = channel_rules or load_channel_rules()
 
     def load_data(self, processed_dir, raw_dir):
         """Load necessary datasets"""
@@ -37,27 +41,14 @@ class BearCartFeatureEngineer:
         # But we need utm_campaign which might be in sessions_clean but not master if create_master dropped it?
         # create_master_dataset used df_sessions.copy() so it should have all columns.
         
-        def define_channel(row):
-            source = str(row.get('traffic_source', '')).lower()
-            campaign = str(row.get('utm_campaign', '')).lower()
-            
-            if source == 'direct':
-                return 'Direct'
-            if 'gsearch' in source or 'bsearch' in source:
-                if 'nonbrand' in campaign or 'brand' in campaign:
-                    return 'Paid Search'
-                return 'Organic Search' # approximation
-            if 'social' in source:
-                return 'Social'
-            return 'Other'
-
         # Ensure utm_campaign is present. If master was built from sessions, it should be there.
         # If not, we merge it.
         if 'utm_campaign' not in df_master.columns:
              temp_sessions = df_sessions[['session_id', 'utm_campaign']]
              df_master = df_master.merge(temp_sessions, on='session_id', how='left')
              
-        df_master['traffic_channel'] = df_master.apply(define_channel, axis=1)
+        # Rules are evaluated once per distinct (source, campaign) pair, not per session
+        df_master['traffic_channel'] = classify_channels(df_master, self.channel_rules)
         
         # 2. Customer Segments
         # is_repeat_session 0/1 -> New vs Returning
@@ -89,6 +80,21 @@ class BearCartFeatureEngineer:
         # Simpler: Merge df_items with df_orders[['order_id', 'was_refunded']]
         # Group by product_id -> mean(was_refunded)
         
+        df_master = self.add_product_risk(df_master, df_orders, df_items)
+        
+        # 4. Time Features
+        df_master['session_date'] = pd.to_datetime(df_master['session_date'])
+        df_master['hour_of_day'] = df_master['session_date'].dt.hour
+        df_master['day_of_week'] = df_master['session_date'].dt.day_name()
+        df_master['is_weekend'] = df_master['session_date'].dt.dayofweek >= 5
+        
+        self.feature_report['features_added'] = ['traffic_channel', 'customer_segment', 'max_product_risk', 'time_features']
+        return df_master
+
+    def add_product_risk(self, df_master, df_orders, df_items):
+        """(Re)compute max_product_risk for every session in df_master.
+        Refund rates are per product across all orders, so any new refund can
+        move the risk of sessions that bought that product."""
         df_items_merged = df_items.merge(df_orders[['order_id', 'was_refunded']], on='order_id', how='left')
         product_risk = df_items_merged.groupby('product_id')['was_refunded'].mean().to_dict()
         
@@ -103,15 +109,8 @@ class BearCartFeatureEngineer:
         df_session_risk = df_session_items.groupby('session_id')['product_risk'].max().reset_index()
         df_session_risk.columns = ['session_id', 'max_product_risk']
         
+        df_master = df_master.drop(columns=['max_product_risk'], errors='ignore')
         df_master = df_master.merge(df_session_risk, on='session_id', how='left')
         df_master['max_product_risk'] = df_master['max_product_risk'].fillna(0.0)
-        
-        # 4. Time Features
-        df_master['session_date'] = pd.to_datetime(df_master['session_date'])
-        df_master['hour_of_day'] = df_master['session_date'].dt.hour
-        df_master['day_of_week'] = df_master['session_date'].dt.day_name()
-        df_master['is_weekend'] = df_master['session_date'].dt.dayofweek >= 5
-        
-        self.feature_report['features_added'] = ['traffic_channel', 'customer_segment', 'max_product_risk', 'time_features']
         return df_master
 
@@ -6,74 +6,177 @@ import os
 logger = logging.getLogger(__name__)
 
 from datetime import datetime, timedelta
+from server.services.rollup import BearCartRollup
+from server.services.aggregation import SESSION_SECTIONS
+from server.utils.cache_utils import VersionedLRUCache, get_dataset_version
+from server.utils.storage_utils import find_table, read_table, require_table
+from server.utils.shared_data import find_snapshot
+from server.utils.schema_utils import MASTER_SCHEMA, apply_schema, log_memory_report
+from server.utils.telemetry import span
+
+# Trailing window length (days before the latest record) for each dashboard range
+TIME_RANGE_DAYS = {
+    'Week': 7,
+    'Month': 30,
+    'Year': 365,
+}
+
+# Top-level keys of the dashboard payload
+DASHBOARD_SECTIONS = SESSION_SECTIONS + ['products']
 
 class BearCartMetrics:
     """Calculate all KPIs for dashboard"""
+
+    # Columns the metrics methods read; everything else is left on disk
+    MASTER_COLUMNS = BearCartRollup.REQUIRED_COLUMNS + ['converted']
+    ITEM_COLUMNS = ['order_item_id', 'created_at', 'order_id', 'product_id', 'product_name',
+                    'price_usd', 'margin_usd', 'is_refunded']
+    REFUND_COLUMNS = ['order_item_id']
     
-    def __init__(self, data_dir=None):
+    def __init__(self, data_dir=None, cache_size=32, shared_dir=None):
+        # Dashboard payloads per (time_range, dataset_version)
+        self.result_cache = VersionedLRUCache(maxsize=cache_size)
+        self.dataset_version = None
+        self.shared_dir = shared_dir
         if data_dir:
             self.load_data(data_dir)
             
     def load_data(self, data_dir):
-        """Load processed data into memory"""
+        """Load processed data into memory (Arrow artifacts are memory-mapped, CSV is the fallback)"""
         self.data_dir = data_dir 
-        self.df_master = pd.read_csv(os.path.join(data_dir, 'master_dataset.csv'))
-        # Ensure date column is datetime
+        dataset_version = get_dataset_version(data_dir)
+
+        # Attach to the snapshot published by the gunicorn master when there is one
+        snapshot_dir = find_snapshot(self.shared_dir, dataset_version)
+        source_dir = snapshot_dir or data_dir
+        if snapshot_dir:
+            logger.info(f"Attaching shared dataset snapshot {snapshot_dir}")
+
+        self.df_master = read_table(require_table(source_dir, 'master_dataset'),
+                                    columns=self.MASTER_COLUMNS, parse_dates=['session_date'])
+        # Compact dtypes (no-op for artifacts the pipeline already wrote with the schema)
+        self.df_master, memory_report = apply_schema(self.df_master, MASTER_SCHEMA)
+        log_memory_report(memory_report)
         if 'session_date' in self.df_master.columns:
-            self.df_master['session_date'] = pd.to_datetime(self.df_master['session_date'])
+            # Keep sessions in time order so date ranges are binary searches
+            self.df_master = self.sort_by_date(self.df_master, 'session_date')
+            self.rollup = BearCartRollup.from_master(self.df_master)
+        else:
+            self.rollup = None
 
-        self.df_orders = pd.read_csv(os.path.join(data_dir, 'orders_clean.csv'))
+        self.df_orders = read_table(require_table(source_dir, 'orders_clean'), parse_dates=['order_date'])
         
         # Load items
-        items_path = os.path.join(data_dir, 'items_clean.csv')
-        if os.path.exists(items_path):
-             self.df_items = pd.read_csv(items_path)
-             if 'created_at' in self.df_items.columns:
-                 self.df_items['created_at'] = pd.to_datetime(self.df_items['created_at'])
-        else:
+        items_path = find_table(source_dir, 'items_clean')
+        if items_path is None:
              # Fallback 
              raw_items_path = os.path.join(data_dir, '../../raw/order_items.csv')
-             if os.path.exists(raw_items_path):
-                 self.df_items = pd.read_csv(raw_items_path)
-                 if 'created_at' in self.df_items.columns:
-                     self.df_items['created_at'] = pd.to_datetime(self.df_items['created_at'])
-             else:
-                 logger.warning("Items data not found.")
-                 self.df_items = pd.DataFrame()
+             items_path = raw_items_path if os.path.exists(raw_items_path) else None
 
-        # Load Refunds 
-        # Load Refunds 
-        refunds_path = os.path.join(data_dir, 'refunds_clean.csv')
-        if os.path.exists(refunds_path):
-             self.df_refunds = pd.read_csv(refunds_path)
+        if items_path is not None:
+             self.df_items = read_table(items_path, columns=self.ITEM_COLUMNS, parse_dates=['created_at'])
+             if 'created_at' in self.df_items.columns:
+                 self.df_items = self.sort_by_date(self.df_items, 'created_at')
         else:
+             logger.warning("Items data not found.")
+             self.df_items = pd.DataFrame()
+
+        # Load Refunds 
+        refunds_path = find_table(source_dir, 'refunds_clean')
+        if refunds_path is None:
              # Fallback
              raw_refunds_path = os.path.join(data_dir, '../../raw/order_item_refunds.csv')
-             if os.path.exists(raw_refunds_path):
-                 self.df_refunds = pd.read_csv(raw_refunds_path)
-             else:
-                 self.df_refunds = pd.DataFrame()
-
-    def filter_by_date(self, df, date_col, time_range):
-        """Filter dataframe by time range relative to max date in data"""
-        if df.empty or date_col not in df.columns:
+             refunds_path = raw_refunds_path if os.path.exists(raw_refunds_path) else None
+
+        if refunds_path is not None:
+             self.df_refunds = read_table(refunds_path, columns=self.REFUND_COLUMNS)
+        else:
+             self.df_refunds = pd.DataFrame()
+
+        # Refund flag per item, computed once (the pipeline writes it; older artifacts don't have it)
+        if not self.df_items.empty and 'is_refunded' not in self.df_items.columns:
+            self.df_items['is_refunded'] = self.refund_flags(self.df_items)
+
+        # Latest timestamps anchor the trailing Week/Month/Year windows
+        self.max_dates = {
+            'session_date': self.df_master['session_date'].max() if 'session_date' in self.df_master.columns else None,
+            'created_at': self.df_items['created_at'].max() if 'created_at' in self.df_items.columns else None,
+        }
+
+        # New data: results computed from the previous version are stale
+        self.dataset_version = dataset_version
+        self.result_cache.invalidate(dataset_version)
+
+    def sort_by_date(self, df, date_col):
+        """Return df ordered by date_col (NaT last), skipping the copy if it already is"""
+        dates = df[date_col]
+        n_dated = int(dates.notna().sum())
+        if dates.iloc[:n_dated].is_monotonic_increasing and dates.iloc[n_dated:].isna().all():
+            # Snapshots are written pre-sorted; re-sorting would make a private copy
             return df
-            
-        max_date = df[date_col].max()
+        return df.sort_values(date_col, kind='stable', na_position='last').reset_index(drop=True)
+
+    def is_sorted_frame(self, df, date_col):
+        """Loaded frames are kept sorted by their date column"""
+        return (df is self.df_master and date_col == 'session_date') or \
+               (df is self.df_items and date_col == 'created_at')
+
+    def get_max_date(self, df, date_col):
+        if self.is_sorted_frame(df, date_col):
+            return self.max_dates.get(date_col)
+        return df[date_col].max()
+
+    def get_start_date(self, df, date_col, time_range):
+        """Start of the time range relative to max date in data (None means no filter)"""
+        if df.empty or date_col not in df.columns or time_range not in TIME_RANGE_DAYS:
+            return None
+
+        max_date = self.get_max_date(df, date_col)
         if pd.isnull(max_date):
+            return None
+
+        return max_date - timedelta(days=TIME_RANGE_DAYS[time_range])
+
+    def get_date_range(self, df, date_col, time_range=None, start_date=None, end_date=None):
+        """(start, end) bounds of a query, end exclusive. Explicit dates win over a named range."""
+        if start_date is not None or end_date is not None:
+            return (pd.Timestamp(start_date) if start_date is not None else None,
+                    pd.Timestamp(end_date) if end_date is not None else None)
+        return self.get_start_date(df, date_col, time_range), None
+
+    def slice_by_date(self, df, date_col, start_date=None, end_date=None):
+        """Rows with start_date <= date < end_date. Sorted frames are sliced with
+        searchsorted (O(log n), no copy); anything else falls back to a mask."""
+        if (start_date is None and end_date is None) or df.empty or date_col not in df.columns:
             return df
-            
-        start_date = None
-        if time_range == 'Week':
-            start_date = max_date - timedelta(days=7)
-        elif time_range == 'Month':
-            start_date = max_date - timedelta(days=30)
-        elif time_range == 'Year':
-            start_date = max_date - timedelta(days=365)
-            
-        if start_date:
-            return df[df[date_col] >= start_date]
-        return df
+
+        if self.is_sorted_frame(df, date_col):
+            dates = df[date_col].values
+            # NaT sorts last and never matches a bounded range
+            n_dated = np.searchsorted(dates, np.datetime64('NaT'), side='left')
+            lo = np.searchsorted(dates[:n_dated], np.datetime64(start_date), side='left') if start_date is not None else 0
+            hi = np.searchsorted(dates[:n_dated], np.datetime64(end_date), side='left') if end_date is not None else n_dated
+            return df.iloc[lo:max(lo, hi)]
+
+        mask = pd.Series(True, index=df.index)
+        if start_date is not None:
+            mask &= df[date_col] >= start_date
+        if end_date is not None:
+            mask &= df[date_col] < end_date
+        return df[mask]
+
+    def filter_by_date(self, df, date_col, time_range=None, start_date=None, end_date=None):
+        """Filter dataframe by time range relative to max date in data, or by explicit [start, end)"""
+        start_date, end_date = self.get_date_range(df, date_col, time_range, start_date, end_date)
+        return self.slice_by_date(df, date_col, start_date, end_date)
+
+    def value_counts(self, series, top=None):
+        """value_counts as a dict, without the zero rows categorical columns report"""
+        counts = series.value_counts()
+        counts = counts[counts > 0]
+        if top is not None:
+            counts = counts.head(top)
+        return counts.to_dict()
 
     def traffic_metrics(self, df=None):
         """Traffic and engagement KPIs"""
@@ -81,7 +184,7 @@ class BearCartMetrics:
         return {
             'total_sessions': int(len(df)),
             'unique_users': int(df['user_id'].nunique()) if 'user_id' in df.columns else 0,
-            'sessions_by_channel': df['traffic_channel'].value_counts().to_dict() if 'traffic_channel' in df.columns else {},
+            'sessions_by_channel': self.value_counts(df['traffic_channel']) if 'traffic_channel' in df.columns else {},
             'total_pageviews': int(df['total_pageviews'].sum()) if 'total_pageviews' in df.columns else 0,
         }
     
@@ -132,39 +235,30 @@ class BearCartMetrics:
         
         return metrics
 
+    def refund_flags(self, df_items):
+        """1 for items that appear in the refunds table (global, not range-filtered), else 0"""
+        if self.df_refunds.empty:
+            return pd.Series(0, index=df_items.index, dtype='int8')
+        return df_items['order_item_id'].isin(self.df_refunds['order_item_id']).astype('int8')
+
     def product_metrics(self, df_items=None):
         """Product performance KPIs from items"""
-        if df_items is not None:
-            df = df_items.copy()
-        else:
-            df = self.df_items.copy()
+        df = df_items if df_items is not None else self.df_items
         
         if df.empty:
             return []
             
-        # Enrich items with refund status (Global refund check, or should we filter refunds too? Keep global for now to see refund rate accurately)
-        if not self.df_refunds.empty:
-            refunded_item_ids = set(self.df_refunds['order_item_id'].unique())
-            if 'is_refunded' not in df.columns:
-                 df['is_refunded'] = df['order_item_id'].apply(lambda x: 1 if x in refunded_item_ids else 0)
-        else:
-            if 'is_refunded' not in df.columns:
-                df['is_refunded'] = 0
+        # Refund status is precomputed at load time; only ad-hoc frames need the lookup
+        if 'is_refunded' not in df.columns:
+            df = df.assign(is_refunded=self.refund_flags(df))
 
         # Group by product
-        df_prod = df.groupby('product_name').agg({
-            'product_id': 'count',
-            'price_usd': 'sum',
-            'margin_usd': 'sum',
-            'is_refunded': 'sum'
-        }).reset_index()
-        
-        df_prod = df_prod.rename(columns={
-            'product_id': 'sales_count', 
-            'price_usd': 'total_revenue', 
-            'margin_usd': 'total_margin',
-            'is_refunded': 'refund_count'
-        })
+        df_prod = df.groupby('product_name', observed=True).agg(
+            sales_count=('product_id', 'count'),
+            total_revenue=('price_usd', 'sum'),
+            total_margin=('margin_usd', 'sum'),
+            refund_count=('is_refunded', 'sum'),
+        ).reset_index()
         
         # Calculate Refund Rate (Refund Count / Sales Count * 100)
         df_prod['refund_rate'] = (df_prod['refund_count'] / df_prod['sales_count'] * 100).round(2)
@@ -186,22 +280,63 @@ class BearCartMetrics:
             'overall_refund_rate': float(refunded_sessions / converted_sessions) if converted_sessions > 0 else 0,
             'total_refunds': int(total_refunds),
             'repeat_customer_rate': float((df['customer_segment'] == 'Returning').sum() / len(df)) if 'customer_segment' in df.columns else 0,
-            'at_risk_segments': df[df['was_refunded'] == 1]['traffic_channel'].value_counts().head(5).to_dict() if 'was_refunded' in df.columns else {},
+            'at_risk_segments': self.value_counts(df[df['was_refunded'] == 1]['traffic_channel'], top=5) if 'was_refunded' in df.columns else {},
         }
 
-    def get_dashboard_data(self, time_range='Month'):
+    def get_dashboard_data(self, time_range='Month', start_date=None, end_date=None, sections=None):
+        """Aggregate all metrics for frontend, cached per dataset version.
+        start_date/end_date select a custom [start, end) range instead of time_range;
+        sections limits the payload to a subset of DASHBOARD_SECTIONS.
+        The returned dict is shared between callers and must not be mutated."""
+        sections = self.normalize_sections(sections)
+        if start_date is not None or end_date is not None:
+            key = ('Custom', start_date and str(pd.Timestamp(start_date)), end_date and str(pd.Timestamp(end_date)))
+        else:
+            key = time_range
+        return self.result_cache.get_or_compute(
+            (key, sections), self.dataset_version,
+            lambda: self.compute_dashboard_data(time_range, start_date, end_date, sections)
+        )
+
+    def normalize_sections(self, sections=None):
+        """Requested sections as a tuple in payload order (all when None)"""
+        if sections is None:
+            return tuple(DASHBOARD_SECTIONS)
+        unknown = set(sections) - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise ValueError(f"Unknown dashboard sections: {sorted(unknown)}. Choose from {DASHBOARD_SECTIONS}")
+        return tuple(s for s in DASHBOARD_SECTIONS if s in sections)
+
+    def compute_dashboard_data(self, time_range='Month', start_date=None, end_date=None, sections=None):
         """Aggregate all metrics for frontend with optional time filtering"""
-        
-        # Filter Master Dataset (Sessions)
-        df_master_filtered = self.filter_by_date(self.df_master, 'session_date', time_range)
-        
-        # Filter Items (Orders)
-        df_items_filtered = self.filter_by_date(self.df_items, 'created_at', time_range)
-        
-        return {
-            'traffic': self.traffic_metrics(df_master_filtered),
-            'conversion': self.conversion_metrics(df_master_filtered),
-            'revenue': self.revenue_metrics(df_master_filtered),
-            'quality': self.quality_metrics(df_master_filtered),
-            'products': self.product_metrics(df_items_filtered)
-        }
+        sections = self.normalize_sections(sections)
+        data = {}
+
+        # Session KPIs come from one fused pass over the pre-aggregated rollup when available
+        if self.rollup is not None:
+            with span('dashboard.session_rollup'):
+                session_start, session_end = self.get_date_range(
+                    self.df_master, 'session_date', time_range, start_date, end_date)
+                data = self.rollup.get_session_metrics(session_start, session_end, sections)
+        elif any(s in sections for s in SESSION_SECTIONS):
+            # Filter Master Dataset (Sessions)
+            with span('dashboard.filter_sessions'):
+                df_master_filtered = self.filter_by_date(self.df_master, 'session_date', time_range, start_date, end_date)
+            section_methods = {
+                'traffic': self.traffic_metrics,
+                'conversion': self.conversion_metrics,
+                'revenue': self.revenue_metrics,
+                'quality': self.quality_metrics,
+            }
+            for s in SESSION_SECTIONS:
+                if s in sections:
+                    with span(f'dashboard.{s}'):
+                        data[s] = section_methods[s](df_master_filtered)
+
+        if 'products' in sections:
+            # Filter Items (Orders)
+            with span('dashboard.products'):
+                df_items_filtered = self.filter_by_date(self.df_items, 'created_at', time_range, start_date, end_date)
+                data['products'] = self.product_metrics(df_items_filtered)
+
+        return data
@@ -6,28 +6,41 @@ from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 import io
 import datetime
+import functools
+
+@functools.lru_cache(maxsize=1)
+def get_report_styles():
+    """Sample stylesheet plus the Brutalist styles, built once per process.
+    Styles are only read while rendering, so renders can share them."""
+    styles = getSampleStyleSheet()
+    BearCartReport.setup_styles(styles)
+    return styles
+
+def render_report(data: dict, time_range: str) -> bytes:
+    """Render a report to PDF bytes (top-level so it can run in a process pool)"""
+    return BearCartReport().generate(data, time_range=time_range).getvalue()
 
 class BearCartReport:
     """Generates PDF reports in Neo-Brutalism style"""
     
-    def __init__(self):
+    def __init__(self, styles=None):
         self.buffer = io.BytesIO()
-        self.styles = getSampleStyleSheet()
-        self.setup_styles()
+        self.styles = styles if styles is not None else get_report_styles()
 
-    def setup_styles(self):
-        self.styles.add(ParagraphStyle(
+    @staticmethod
+    def setup_styles(styles):
+        styles.add(ParagraphStyle(
             name='BrutalistTitle',
-            parent=self.styles['Title'],
+            parent=styles['Title'],
             fontName='Helvetica-Bold',
             fontSize=24,
             leading=28,
             textColor=colors.black,
             spaceAfter=20,
         ))
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='BrutalistHeader',
-            parent=self.styles['Heading2'],
+            parent=styles['Heading2'],
             fontName='Helvetica-Bold',
             fontSize=14,
             leading=16,
@@ -39,9 +52,9 @@ class BearCartReport:
             borderWidth=2,
             backColor=colors.white,
         ))
-        self.styles.add(ParagraphStyle(
+        styles.add(ParagraphStyle(
             name='NormalBold',
-            parent=self.styles['Normal'],
+            parent=styles['Normal'],
             fontName='Helvetica-Bold',
             fontSize=10,
         ))
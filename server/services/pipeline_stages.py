@@ -0,0 +1,137 @@
+"""
+Stage graph of the full BearCart pipeline.
+
+Each stage is a top-level function (so it can run in a worker process) that
+takes its raw file paths and upstream outputs and returns (output, report).
+Reports carry the cleaner/feature counters and the raw-table watermarks,
+since the cleaner instances live and die inside the workers. Rows dropped only
+because their parent row isn't in the export yet are returned as well, to be
+held back for the next incremental run.
+"""
+import os
+import logging
+
+from server.services.data_cleaner import BearCartDataCleaner
+from server.services.feature_engineer import BearCartFeatureEngineer
+from server.utils.dag_utils import Stage, load_output
+from server.utils.rule_utils import funnel_rules_path, channel_rules_path
+from server.utils.schema_utils import MASTER_SCHEMA, apply_schema
+from server.utils.storage_utils import write_table, append_csv
+from server.utils.watermark_utils import WATERMARK_COLUMNS, table_mark
+
+logger = logging.getLogger(__name__)
+
+CLEANER = 'server.services.data_cleaner'
+RULES = 'server.utils.rule_utils'
+RAW = 'server.utils.raw_schema_utils'
+FEATURES = 'server.services.feature_engineer'
+SCHEMA = 'server.utils.schema_utils'
+
+def load_raw(cleaner, path):
+    df, _ = cleaner.load_and_profile(path)
+    if df is None:
+        raise FileNotFoundError(path)
+    return df
+
+def watermark(path, df, table):
+    return table_mark(path, df, WATERMARK_COLUMNS[table])
+
+def sessions_stage(path):
+    cleaner = BearCartDataCleaner()
+    df = load_raw(cleaner, path)
+    mark = watermark(path, df, 'website_sessions')
+    return cleaner.clean_sessions(df), {'cleaning_report': cleaner.cleaning_report, 'watermark': mark}
+
+def pageviews_stage(path):
+    """Largest table: streamed in chunks (BEARCART_PAGEVIEW_CHUNKSIZE rows) to bound memory"""
+    cleaner = BearCartDataCleaner()
+    chunksize = int(os.getenv('BEARCART_PAGEVIEW_CHUNKSIZE', '500000'))
+    df_funnel, profile = cleaner.clean_pageviews_chunked(path, chunksize=chunksize)
+    if df_funnel is None:
+        raise FileNotFoundError(path)
+    mark = table_mark(path, None, WATERMARK_COLUMNS['website_pageviews'], value=profile['max_pageview_id'] or 0)
+    return df_funnel, {'cleaning_report': cleaner.cleaning_report, 'watermark': mark}
+
+def products_stage(path):
+    cleaner = BearCartDataCleaner()
+    df = load_raw(cleaner, path)
+    return cleaner.clean_products(df), {'cleaning_report': cleaner.cleaning_report}
+
+def orders_stage(path, df_sessions_clean):
+    cleaner = BearCartDataCleaner()
+    df = load_raw(cleaner, path)
+    mark = watermark(path, df, 'orders')
+    return cleaner.clean_orders(df, df_sessions_clean), {'cleaning_report': cleaner.cleaning_report, 'watermark': mark}
+
+def refunds_stage(path, df_orders_clean):
+    cleaner = BearCartDataCleaner()
+    df = load_raw(cleaner, path)
+    mark = watermark(path, df, 'order_item_refunds')
+    return cleaner.clean_refunds(df, df_orders_clean), {'cleaning_report': cleaner.cleaning_report, 'watermark': mark}
+
+def items_stage(path, df_orders_clean, df_products_clean, df_refunds_clean):
+    """Clean items, plus the raw rows of items whose order hasn't arrived"""
+    cleaner = BearCartDataCleaner()
+    df = load_raw(cleaner, path)
+    mark = watermark(path, df, 'order_items')
+    df_orphans = df[~df['order_id'].isin(df_orders_clean['order_id'])]
+    df_items_clean = cleaner.clean_order_items(df, df_orders_clean, df_products_clean, df_refunds_clean)
+    return (df_items_clean, df_orphans), {'cleaning_report': cleaner.cleaning_report, 'watermark': mark}
+
+def master_stage(df_sessions_clean, df_orders_clean, df_refunds_clean, df_funnel_agg):
+    """Master dataset, plus the orders with the was_refunded flag it adds and the
+    funnel profiles of pageviews whose session hasn't arrived"""
+    cleaner = BearCartDataCleaner()
+    df_master = cleaner.create_master_dataset(df_sessions_clean, df_orders_clean, df_refunds_clean, df_funnel_agg)
+    df_orphan_funnel = df_funnel_agg[~df_funnel_agg['session_id'].isin(df_sessions_clean['session_id'])]
+    return (df_master, df_orders_clean, df_orphan_funnel), {'cleaning_report': cleaner.cleaning_report}
+
+def features_stage(master_output, df_sessions_clean, items_output):
+    df_master, df_orders_clean, _ = master_output
+    df_items_clean, _ = items_output
+    fe = BearCartFeatureEngineer()
+    df_master_features = fe.engineer_features(df_master, df_sessions_clean, df_orders_clean, df_items_clean)
+
+    # Compact dtypes: categorical strings, downcast counters, one-byte flags
+    df_master_features, memory_report = apply_schema(df_master_features, MASTER_SCHEMA)
+    return df_master_features, {'feature_report': fe.feature_report, 'memory_report': memory_report}
+
+PIPELINE_STAGES = [
+    Stage('sessions', sessions_stage, files=['raw/website_sessions.csv'], code=[CLEANER, RAW]),
+    # Rule files are code too: editing one re-runs its stage and everything downstream
+    Stage('pageviews', pageviews_stage, files=['raw/website_pageviews.csv'],
+          code=[CLEANER, RULES, RAW] + ([funnel_rules_path()] if funnel_rules_path() else [])),
+    Stage('products', products_stage, files=['raw/products.csv'], code=[CLEANER, RAW]),
+    Stage('orders', orders_stage, deps=['sessions'], files=['raw/orders.csv'], code=[CLEANER, RAW]),
+    Stage('refunds', refunds_stage, deps=['orders'], files=['raw/order_item_refunds.csv'], code=[CLEANER, RAW]),
+    Stage('items', items_stage, deps=['orders', 'products', 'refunds'], files=['raw/order_items.csv'], code=[CLEANER, RAW]),
+    Stage('master', master_stage, deps=['sessions', 'orders', 'refunds', 'pageviews'], code=[CLEANER]),
+    Stage('features', features_stage, deps=['master', 'sessions', 'items'],
+          code=[FEATURES, SCHEMA, RULES] + ([channel_rules_path()] if channel_rules_path() else [])),
+]
+
+# (stage, part of its output or None, processed table name, cleaned CSV name or None)
+PIPELINE_OUTPUTS = [
+    ('sessions', None, 'sessions_clean', 'website_sessions_clean.csv'),
+    ('master', 1, 'orders_clean', 'orders_clean.csv'),
+    ('items', 0, 'items_clean', 'order_items_clean.csv'),
+    ('products', None, 'products_clean', 'products_clean.csv'),
+    ('refunds', None, 'refunds_clean', 'order_item_refunds_clean.csv'),
+    ('features', None, 'master_dataset', None),
+]
+
+# (stage, part of its output, pending table) for rows held back until their parent arrives
+PIPELINE_PENDING = [
+    ('items', 1, 'order_items'),
+    ('master', 2, 'funnel_profiles'),
+]
+
+def write_output(output_path, part, processed_dir, name, formats, cleaned_path=None):
+    """Write one stage output as a processed table (and cleaned CSV); runs in a worker"""
+    df = load_output(output_path)
+    if part is not None:
+        df = df[part]
+    if cleaned_path:
+        append_csv(df, cleaned_path)
+    write_table(df, processed_dir, name, formats)
+    return name
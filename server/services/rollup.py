@@ -0,0 +1,126 @@
+import pandas as pd
+import numpy as np
+import logging
+from server.services.aggregation import BearCartAggregator
+
+logger = logging.getLogger(__name__)
+
+class BearCartRollup:
+    """Pre-aggregated daily rollup cube over the session-level master dataset"""
+
+    DIMENSIONS = ['traffic_channel', 'device_type', 'customer_segment']
+    FUNNEL_STEPS = {
+        'sessions': 'step_home',
+        'products': 'step_product',
+        'cart': 'step_cart',
+        'shipping': 'step_shipping',
+        'billing': 'step_billing',
+        'purchase': 'step_thankyou',
+    }
+    REQUIRED_COLUMNS = ['session_date', 'user_id', 'conversion_flag', 'total_order_value',
+                        'was_refunded', 'total_pageviews'] + DIMENSIONS + list(FUNNEL_STEPS.values())
+
+    def __init__(self, df_master):
+        """Build the cube once. df_master must be sorted by session_date."""
+        self.df_master = df_master
+        self.aggregator = BearCartAggregator(self.FUNNEL_STEPS)
+        self.cube = self._aggregate(df_master)
+
+        # Sorted day keys of the cube (NaT rows are grouped last and only count towards 'All')
+        self._days = self.cube['day'].values
+        self._n_dated_days = int(self.cube['day'].notna().sum())
+
+        # Sorted session timestamps so boundary days can be sliced without a full scan
+        self._dates = df_master['session_date'].values
+        self._n_dated_sessions = int(df_master['session_date'].notna().sum())
+
+        # Distinct users in a trailing window == users whose last session falls inside it
+        last_seen = df_master.groupby('user_id')['session_date'].max().dropna()
+        self._user_last_seen = np.sort(last_seen.values)
+        self._total_users = int(df_master['user_id'].nunique())
+
+        logger.info(f"  ✓ Rollup cube: {len(self.cube)} rows from {len(df_master)} sessions")
+
+    @classmethod
+    def from_master(cls, df_master):
+        """Build a rollup if the master dataset has the pipeline schema, else None"""
+        missing = [col for col in cls.REQUIRED_COLUMNS if col not in df_master.columns]
+        if missing:
+            logger.warning(f"Rollup disabled, master dataset is missing columns: {missing}")
+            return None
+        return cls(df_master)
+
+    def _aggregate(self, df):
+        """Sum session rows into day x channel x device x segment cells"""
+        measures = pd.DataFrame({
+            'sessions': 1,
+            'conversions': df['conversion_flag'],
+            'revenue': df['total_order_value'],
+            'refunds': df['was_refunded'],
+            'returning': (df['customer_segment'] == 'Returning').astype(int),
+            'pageviews': df['total_pageviews'],
+            **{col: df[col] for col in self.FUNNEL_STEPS.values()},
+        }, index=df.index)
+
+        keys = [df['session_date'].dt.normalize().rename('day')] + [df[dim] for dim in self.DIMENSIONS]
+        return measures.groupby(keys, dropna=False, observed=True, sort=True).sum().reset_index()
+
+    def _session_slice(self, start_date, end_date):
+        """Raw sessions in [start_date, end_date) via binary search over the sorted timestamps"""
+        dates = self._dates[:self._n_dated_sessions]
+        lo = np.searchsorted(dates, np.datetime64(start_date), side='left')
+        hi = np.searchsorted(dates, np.datetime64(end_date), side='left')
+        return self.df_master.iloc[lo:max(lo, hi)]
+
+    def window(self, start_date=None, end_date=None):
+        """Rollup rows for sessions in [start_date, end_date) (open-ended where None).
+
+        Whole days come straight from the cube. Partial first/last days are
+        re-aggregated from the raw sessions of those days only.
+        """
+        if start_date is None and end_date is None:
+            return self.cube
+
+        start_date = pd.Timestamp(start_date) if start_date is not None else None
+        end_date = pd.Timestamp(end_date) if end_date is not None else None
+
+        # Midnights bounding the whole days inside the range
+        full_start = start_date.ceil('D') if start_date is not None else None
+        full_end = end_date.floor('D') if end_date is not None else None
+
+        if full_start is not None and full_end is not None and full_start > full_end:
+            # Range lies within a single day
+            return self._aggregate(self._session_slice(start_date, end_date))
+
+        days = self._days[:self._n_dated_days]
+        lo = np.searchsorted(days, np.datetime64(full_start), side='left') if full_start is not None else 0
+        hi = np.searchsorted(days, np.datetime64(full_end), side='left') if full_end is not None else self._n_dated_days
+        parts = [self.cube.iloc[lo:hi]]
+
+        if start_date is not None and start_date < full_start:
+            parts.insert(0, self._aggregate(self._session_slice(start_date, full_start)))
+        if end_date is not None and full_end < end_date:
+            parts.append(self._aggregate(self._session_slice(full_end, end_date)))
+
+        parts = [part for part in parts if not part.empty] or parts[:1]
+        return parts[0] if len(parts) == 1 else pd.concat(parts, ignore_index=True)
+
+    def unique_users(self, start_date=None, end_date=None):
+        """Distinct users with a session in [start_date, end_date)"""
+        if start_date is None and end_date is None:
+            return self._total_users
+        if end_date is None:
+            # Trailing window: users whose last session falls inside it
+            lo = np.searchsorted(self._user_last_seen, np.datetime64(pd.Timestamp(start_date)), side='left')
+            return int(len(self._user_last_seen) - lo)
+        start_date = pd.Timestamp(start_date) if start_date is not None else pd.Timestamp.min
+        return int(self._session_slice(start_date, pd.Timestamp(end_date))['user_id'].nunique())
+
+    def get_session_metrics(self, start_date=None, end_date=None, sections=None):
+        """Traffic, conversion, revenue and quality sections (or the requested subset)
+        for sessions in [start_date, end_date)"""
+        return self.aggregator.compute(
+            self.window(start_date, end_date),
+            sections=sections,
+            unique_users=lambda: self.unique_users(start_date, end_date),
+        )
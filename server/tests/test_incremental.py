@@ -0,0 +1,81 @@
+"""Incremental pipeline runs against a full rebuild of the same raw data"""
+import os
+
+import pandas as pd
+import pytest
+
+from server.benchmarks.synthetic_data import TABLES, generate_raw
+from server.run_pipeline import run
+from server.utils.storage_utils import read_table
+
+# Processed table -> key its rows are compared by
+OUTPUTS = {
+    'sessions_clean': 'session_id',
+    'orders_clean': 'order_id',
+    'items_clean': 'order_item_id',
+    'refunds_clean': 'order_item_refund_id',
+    'master_dataset': 'session_id',
+}
+
+@pytest.fixture(scope='module')
+def raw_lines(tmp_path_factory):
+    """Lines of each synthetic raw CSV (header first), and the products file"""
+    raw_dir = tmp_path_factory.mktemp('synthetic')
+    generate_raw(str(raw_dir), scale=0.004, seed=7)
+    lines = {}
+    for table in TABLES + ['products']:
+        with open(raw_dir / f'{table}.csv', 'rb') as f:
+            lines[table] = f.readlines()
+    return lines
+
+def write_raw(base_dir, raw_lines, shares):
+    """Raw CSVs holding the first share of each table's rows (the rest of the export arrives later)"""
+    raw_dir = os.path.join(base_dir, 'raw')
+    os.makedirs(raw_dir, exist_ok=True)
+    for table, lines in raw_lines.items():
+        rows = lines[1:]
+        count = int(len(rows) * shares.get(table, 1.0))
+        with open(os.path.join(raw_dir, f'{table}.csv'), 'wb') as f:
+            f.writelines([lines[0]] + rows[:count])
+
+def read_outputs(base_dir):
+    processed = os.path.join(base_dir, 'data', 'processed')
+    return {name: read_table(os.path.join(processed, f'{name}.arrow')).sort_values(key, ignore_index=True)
+            for name, key in OUTPUTS.items()}
+
+def assert_same_outputs(actual, expected):
+    for name in OUTPUTS:
+        pd.testing.assert_frame_equal(actual[name][expected[name].columns], expected[name],
+                                      check_dtype=False, check_categorical=False, obj=name)
+
+def run_pipeline(base_dir, incremental):
+    run(formats=('arrow',), incremental=incremental, base_dir=str(base_dir), workers=1, use_cache=False)
+
+def test_synthetic_append_matches_full_rebuild(tmp_path, raw_lines):
+    inc_dir, full_dir = tmp_path / 'incremental', tmp_path / 'full'
+    write_raw(inc_dir, raw_lines, {table: 0.5 for table in TABLES})
+    run_pipeline(inc_dir, incremental=False)
+    write_raw(inc_dir, raw_lines, {table: 0.7 for table in TABLES})
+    run_pipeline(inc_dir, incremental=True)
+
+    write_raw(full_dir, raw_lines, {table: 0.7 for table in TABLES})
+    run_pipeline(full_dir, incremental=False)
+    assert_same_outputs(read_outputs(inc_dir), read_outputs(full_dir))
+
+def test_children_ahead_of_parents_match_full_rebuild(tmp_path, raw_lines):
+    """Pageviews, orders, items and refunds exported before their session or order"""
+    inc_dir, full_dir = tmp_path / 'incremental', tmp_path / 'full'
+    write_raw(inc_dir, raw_lines, {table: 0.5 for table in TABLES})
+    run_pipeline(inc_dir, incremental=False)
+    write_raw(inc_dir, raw_lines, {'website_sessions': 0.55, 'orders': 0.8, 'website_pageviews': 0.8,
+                                   'order_items': 0.8, 'order_item_refunds': 0.8})
+    run_pipeline(inc_dir, incremental=True)
+    pending = os.listdir(os.path.join(inc_dir, 'data', 'processed', 'pending'))
+    assert {'funnel_profiles.arrow', 'orders.arrow', 'order_items.arrow'} <= set(pending)
+
+    write_raw(inc_dir, raw_lines, {table: 0.9 for table in TABLES})
+    run_pipeline(inc_dir, incremental=True)
+
+    write_raw(full_dir, raw_lines, {table: 0.9 for table in TABLES})
+    run_pipeline(full_dir, incremental=False)
+    assert_same_outputs(read_outputs(inc_dir), read_outputs(full_dir))
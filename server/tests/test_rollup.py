@@ -0,0 +1,95 @@
+"""BearCartRollup windows against the same KPIs computed from the session rows"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from server.services.rollup import BearCartRollup
+
+MEASURES = {
+    'sessions': lambda df: len(df),
+    'conversions': lambda df: df['conversion_flag'].sum(),
+    'revenue': lambda df: df['total_order_value'].sum(),
+    'refunds': lambda df: df['was_refunded'].sum(),
+    'returning': lambda df: (df['customer_segment'] == 'Returning').sum(),
+    'pageviews': lambda df: df['total_pageviews'].sum(),
+    'step_cart': lambda df: df['step_cart'].sum(),
+}
+
+@pytest.fixture(scope='module')
+def df_master():
+    """Sessions at random times over ten days (with a day without any), a few undated, sorted like the pipeline output"""
+    rng = np.random.default_rng(3)
+    n = 2000
+    start = pd.Timestamp('2015-01-01')
+    seconds = rng.integers(0, 10 * 86400, n)
+    seconds = seconds[(seconds < 4 * 86400) | (seconds >= 5 * 86400)]
+    dates = pd.Series(start + pd.to_timedelta(np.sort(seconds), unit='s'))
+    dates = pd.concat([dates, pd.Series([pd.NaT] * 5)], ignore_index=True)
+    n = len(dates)
+    converted = rng.random(n) < 0.1
+    df = pd.DataFrame({
+        'session_date': dates,
+        'user_id': rng.integers(0, 600, n),
+        'conversion_flag': converted.astype(int),
+        'total_order_value': np.where(converted, rng.uniform(20, 120, n).round(2), 0.0),
+        'was_refunded': (converted & (rng.random(n) < 0.2)).astype(int),
+        'total_pageviews': rng.integers(1, 8, n),
+        'traffic_channel': pd.Categorical(rng.choice(['Paid Search', 'Organic', 'Direct'], n)),
+        'device_type': pd.Categorical(rng.choice(['desktop', 'mobile'], n)),
+        'customer_segment': pd.Categorical(rng.choice(['New', 'Returning'], n)),
+    })
+    for step in BearCartRollup.FUNNEL_STEPS.values():
+        df[step] = (rng.random(n) < 0.5).astype(int)
+    return df
+
+@pytest.fixture(scope='module')
+def rollup(df_master):
+    return BearCartRollup(df_master)
+
+def row_window(df, start, end):
+    mask = pd.Series(True, index=df.index)
+    if start is not None:
+        mask &= df['session_date'] >= pd.Timestamp(start)
+    if end is not None:
+        mask &= df['session_date'] < pd.Timestamp(end)
+    return df[mask]
+
+WINDOWS = [
+    (None, None),
+    ('2015-01-02 06:30', '2015-01-07 17:45'),   # partial first and last day
+    ('2015-01-03', '2015-01-06'),               # whole days
+    ('2015-01-03 10:00', '2015-01-03 14:00'),   # inside one day
+    ('2015-01-03 10:00', '2015-01-04'),         # partial day up to midnight
+    ('2015-01-08 12:00', None),                 # open end
+    (None, '2015-01-02 09:15'),                 # open start
+]
+
+EMPTY_WINDOWS = [
+    ('2015-01-05 03:00', '2015-01-05 21:00'),   # the day without sessions
+    ('2015-01-04 00:00', '2015-01-04 00:00'),   # zero-length
+    ('2014-12-01', '2014-12-15'),               # before the data
+    ('2015-02-01 08:00', None),                 # after the data
+]
+
+@pytest.mark.parametrize('start, end', WINDOWS + EMPTY_WINDOWS)
+def test_window_matches_session_rows(rollup, df_master, start, end):
+    cube = rollup.window(start, end)
+    rows = row_window(df_master, start, end)
+    for measure, expected in MEASURES.items():
+        assert cube[measure].sum() == pytest.approx(expected(rows)), measure
+
+    by_channel = cube.groupby('traffic_channel', observed=True)['sessions'].sum()
+    expected = rows.groupby('traffic_channel', observed=True).size()
+    pd.testing.assert_series_equal(by_channel[by_channel > 0], expected[expected > 0],
+                                   check_names=False, check_dtype=False, check_index_type=False)
+
+@pytest.mark.parametrize('start, end', WINDOWS + EMPTY_WINDOWS)
+def test_unique_users_match_session_rows(rollup, df_master, start, end):
+    assert rollup.unique_users(start, end) == row_window(df_master, start, end)['user_id'].nunique()
+
+@pytest.mark.parametrize('start, end', EMPTY_WINDOWS)
+def test_empty_window_metrics(rollup, start, end):
+    data = rollup.get_session_metrics(start, end)
+    assert data['traffic']['total_sessions'] == 0
+    assert data['traffic']['unique_users'] == 0
+    assert data['revenue']['total_revenue'] == 0
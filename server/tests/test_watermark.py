@@ -0,0 +1,41 @@
+"""read_new_rows on raw CSVs that are still being appended to"""
+from server.utils.watermark_utils import read_new_rows
+
+HEADER = 'order_id,created_at,website_session_id,user_id,primary_product_id,items_purchased,price_usd,cogs_usd\n'
+
+def order_line(order_id):
+    return f'{order_id},2015-01-01 10:{order_id:02d}:00,{100 + order_id},{order_id},1,1,49.99,19.49\n'
+
+def test_half_written_last_line_waits_for_the_next_run(tmp_path):
+    path = tmp_path / 'orders.csv'
+    partial = order_line(4)[:20]
+    path.write_text(HEADER + ''.join(order_line(i) for i in range(1, 4)) + partial)
+
+    df, mark = read_new_rows(str(path), None, 'order_id')
+    assert df['order_id'].tolist() == [1, 2, 3]
+    assert mark['value'] == 3
+    assert mark['offset'] == len(HEADER) + sum(len(order_line(i)) for i in range(1, 4))
+
+    with open(path, 'a') as f:
+        f.write(order_line(4)[20:] + order_line(5))
+    df, mark = read_new_rows(str(path), mark, 'order_id')
+    assert df['order_id'].tolist() == [4, 5]
+    assert df['price_usd'].dtype == 'float64'
+    assert mark['value'] == 5
+    assert mark['offset'] == path.stat().st_size
+
+def test_reappended_old_id_is_skipped(tmp_path):
+    path = tmp_path / 'orders.csv'
+    path.write_text(HEADER + ''.join(order_line(i) for i in range(1, 4)))
+    _, mark = read_new_rows(str(path), None, 'order_id')
+
+    with open(path, 'a') as f:
+        f.write(order_line(2) + order_line(4))
+    df, mark = read_new_rows(str(path), mark, 'order_id')
+    assert df['order_id'].tolist() == [4]
+    assert mark['value'] == 4
+
+    # Nothing new: an empty frame and the same id mark
+    df, mark = read_new_rows(str(path), mark, 'order_id')
+    assert df.empty
+    assert mark['value'] == 4
@@ -0,0 +1,86 @@
+"""
+In-process result caching keyed by dataset version
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+def get_dataset_version(data_dir: str) -> str:
+    """
+    Fingerprint of the processed data files (name, size, mtime).
+    Changes whenever run_pipeline rewrites an output.
+    """
+    digest = hashlib.sha1()
+    if os.path.isdir(data_dir):
+        for name in sorted(os.listdir(data_dir)):
+            path = os.path.join(data_dir, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()[:12]
+
+class VersionedLRUCache:
+    """Thread-safe LRU cache whose entries are keyed by (key, dataset version)"""
+
+    def __init__(self, maxsize: int = 32):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, version: str, default: Any = None) -> Any:
+        with self._lock:
+            entry_key = (key, version)
+            if entry_key in self._entries:
+                self._entries.move_to_end(entry_key)
+                self.hits += 1
+                return self._entries[entry_key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, version: str, value: Any) -> None:
+        with self._lock:
+            entry_key = (key, version)
+            self._entries[entry_key] = value
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key: Hashable, version: str, compute: Callable[[], Any]) -> Any:
+        """Return the cached value or compute and store it (computation runs outside the lock)"""
+        sentinel = object()
+        value = self.get(key, version, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.set(key, version, value)
+        return value
+
+    def invalidate(self, version: Optional[str] = None) -> None:
+        """Drop every entry, or only those not matching the given current version"""
+        with self._lock:
+            if version is None:
+                self._entries.clear()
+            else:
+                for entry_key in [k for k in self._entries if k[1] != version]:
+                    del self._entries[entry_key]
+            self.invalidations += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "invalidations": self.invalidations,
+            }
@@ -0,0 +1,125 @@
+"""
+Off-event-loop execution for blocking pandas, reportlab and LLM work.
+
+Each kind of work gets its own bounded thread pool so slow Gemini calls or
+PDF renders can't occupy the threads /api/dashboard needs, and each endpoint
+has a concurrency limit on top of that. CPU-bound rendering that holds the
+GIL runs in a process pool instead. Identical concurrent requests can be
+coalesced into one computation with single_flight.
+"""
+import os
+import asyncio
+import functools
+import logging
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Pool name -> default thread count (override with BEARCART_<NAME>_THREADS)
+POOL_SIZES = {
+    'metrics': 4,
+    'llm': 8,
+}
+
+# Process pool name -> default process count (override with BEARCART_<NAME>_PROCESSES)
+PROCESS_POOL_SIZES = {
+    'render': 2,
+}
+
+# Endpoint -> max requests in flight per worker (override with BEARCART_<NAME>_CONCURRENCY)
+ENDPOINT_LIMITS = {
+    'dashboard': 32,
+    'forecast': 8,
+    'chat': 4,
+    'insights': 4,
+    'export_pdf': 2,
+}
+
+_executors: Dict[str, Executor] = {}
+_limits: Dict[str, asyncio.Semaphore] = {}
+
+# (endpoint, key) -> task computing the shared result
+_inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+# endpoint -> {'requests', 'executed', 'coalesced'}
+_flight_counts: Dict[str, Dict[str, int]] = {}
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+def get_executor(pool: str) -> ThreadPoolExecutor:
+    if pool not in _executors:
+        size = _env_int(f"BEARCART_{pool.upper()}_THREADS", POOL_SIZES[pool])
+        _executors[pool] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"bearcart-{pool}")
+    return _executors[pool]
+
+def get_process_executor(pool: str) -> ProcessPoolExecutor:
+    if pool not in _executors:
+        size = _env_int(f"BEARCART_{pool.upper()}_PROCESSES", PROCESS_POOL_SIZES[pool])
+        # spawn: forking a process that already runs threads can deadlock the child
+        _executors[pool] = ProcessPoolExecutor(max_workers=size, mp_context=multiprocessing.get_context('spawn'))
+    return _executors[pool]
+
+async def run_in_process(pool: str, fn: Callable, *args) -> Any:
+    """Run a picklable top-level function on the named process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_process_executor(pool), fn, *args)
+
+async def run_in_pool(pool: str, fn: Callable, *args, **kwargs) -> Any:
+    """Run a blocking callable on the named pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(pool), functools.partial(fn, *args, **kwargs))
+
+@asynccontextmanager
+async def endpoint_limit(endpoint: str):
+    """Cap concurrent requests for an endpoint; excess requests wait their turn"""
+    if endpoint not in _limits:
+        limit = _env_int(f"BEARCART_{endpoint.upper()}_CONCURRENCY", ENDPOINT_LIMITS[endpoint])
+        _limits[endpoint] = asyncio.Semaphore(limit)
+    async with _limits[endpoint]:
+        yield
+
+async def single_flight(endpoint: str, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Run fn() once for concurrent requests with the same endpoint and key; later
+    arrivals await the in-flight result instead of recomputing it. The shared
+    task is shielded, so a disconnecting caller doesn't cancel it for the rest.
+    """
+    counts = _flight_counts.setdefault(endpoint, {'requests': 0, 'executed': 0, 'coalesced': 0})
+    counts['requests'] += 1
+
+    flight_key = (endpoint, key)
+    task = _inflight.get(flight_key)
+    if task is None:
+        counts['executed'] += 1
+        task = asyncio.ensure_future(fn())
+        _inflight[flight_key] = task
+
+        def finished(done: asyncio.Task) -> None:
+            _inflight.pop(flight_key, None)
+            # Mark a failure as retrieved even if every caller has gone away
+            if not done.cancelled():
+                done.exception()
+
+        task.add_done_callback(finished)
+    else:
+        counts['coalesced'] += 1
+    return await asyncio.shield(task)
+
+def single_flight_stats() -> Dict[str, Any]:
+    """Per-endpoint request/coalescing counters for this worker"""
+    return {
+        'in_flight': len(_inflight),
+        'endpoints': {endpoint: dict(counts) for endpoint, counts in _flight_counts.items()},
+    }
+
+def shutdown_pools() -> None:
+    for pool, executor in _executors.items():
+        executor.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"Shut down {pool} pool")
+    _executors.clear()
@@ -0,0 +1,122 @@
+"""
+Compact, token-budgeted LLM context built from the dashboard payload.
+
+The raw payload carries one revenue record per day and every product, so
+embedding it verbatim makes prompts grow with the date range. The compact
+form keeps the KPIs and breakdowns, the top-N products and a weekly revenue
+series, and is shrunk step by step until it fits the token budget.
+"""
+import json
+import logging
+from typing import Any, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough English/JSON average for Gemini tokenizers
+CHARS_PER_TOKEN = 4
+
+# Tried in order until the context fits the budget: (top products, series frequency)
+REDUCTION_STEPS = [
+    (10, 'weekly'),
+    (5, 'weekly'),
+    (5, 'monthly'),
+    (3, 'monthly'),
+    (3, None),
+    (0, None),
+]
+
+SERIES_RULES = {
+    'weekly': 'W-MON',
+    'monthly': 'MS',
+}
+
+def estimate_tokens(text: str) -> int:
+    """Approximate token count of a prompt string"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def dumps_compact(obj: Any) -> str:
+    return json.dumps(obj, separators=(',', ':'))
+
+def _round(value: Any, digits: int = 4) -> Any:
+    """Floats to a few significant digits; everything else unchanged"""
+    if isinstance(value, float):
+        return float(f"{value:.{digits}g}") if abs(value) < 10 ** digits else round(value)
+    if isinstance(value, dict):
+        return {k: _round(v, digits) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_round(v, digits) for v in value]
+    return value
+
+def downsample_series(records: List[Dict[str, Any]], freq: str) -> List[List[Any]]:
+    """Daily revenue records -> [[period start, revenue], ...] at the given frequency"""
+    if not records:
+        return []
+    # Imported here so importing the chat agent doesn't pull in pandas at startup
+    import pandas as pd
+    daily = pd.Series(
+        [r['total_order_value'] for r in records],
+        index=pd.to_datetime([r['session_date'] for r in records]),
+    )
+    periods = daily.resample(SERIES_RULES[freq], label='left', closed='left').sum()
+    return [[day, round(float(value), 2)] for day, value in zip(periods.index.strftime('%Y-%m-%d'), periods.tolist())]
+
+def top_products(products: List[Dict[str, Any]], n: int) -> List[Dict[str, Any]]:
+    ranked = sorted(products, key=lambda p: p.get('total_revenue', 0), reverse=True)[:n]
+    return [
+        {
+            'name': p.get('product_name'),
+            'sales': p.get('sales_count'),
+            'revenue': p.get('total_revenue'),
+            'margin': p.get('total_margin'),
+            'refund_rate_pct': p.get('refund_rate'),
+        }
+        for p in ranked
+    ]
+
+def summarize(data: Dict[str, Any], n_products: int = 10, series: str = 'weekly') -> Dict[str, Any]:
+    """One compact rendering of the dashboard payload"""
+    context = {}
+
+    traffic = data.get('traffic')
+    if traffic:
+        context['traffic'] = dict(traffic)
+
+    conversion = data.get('conversion')
+    if conversion:
+        context['conversion'] = dict(conversion)
+
+    revenue = data.get('revenue')
+    if revenue:
+        context['revenue'] = {k: v for k, v in revenue.items() if k != 'revenue_over_time'}
+        if series:
+            context['revenue'][f'revenue_{series}'] = downsample_series(revenue.get('revenue_over_time') or [], series)
+
+    quality = data.get('quality')
+    if quality:
+        context['quality'] = dict(quality)
+
+    products = data.get('products')
+    if products and n_products:
+        context['top_products'] = top_products(products, n_products)
+
+    # Any extra keys the caller added (e.g. the selected range) pass through as-is
+    for key, value in data.items():
+        if key not in ('traffic', 'conversion', 'revenue', 'quality', 'products'):
+            context[key] = value
+
+    return _round(context)
+
+def build_llm_context(data: Dict[str, Any], token_budget: int) -> Tuple[str, int]:
+    """
+    Compact JSON context for the dashboard payload within token_budget.
+    Returns the serialized context and its estimated token count.
+    """
+    for n_products, series in REDUCTION_STEPS:
+        context_str = dumps_compact(summarize(data, n_products=n_products, series=series))
+        tokens = estimate_tokens(context_str)
+        if tokens <= token_budget:
+            return context_str, tokens
+
+    # KPIs alone exceed the budget; send them anyway rather than nothing
+    logger.warning(f"LLM context is {tokens} tokens, over the {token_budget} token budget")
+    return context_str, tokens
@@ -0,0 +1,183 @@
+"""
+Stage-graph executor with content-hash caching for the data pipeline.
+
+Stages declare the raw files and upstream stages they read. Independent
+stages run concurrently on a process pool; each stage's output is pickled
+to the cache under a key derived from its input files' contents, its
+upstream keys and its code, so a rerun skips every stage whose inputs and
+code are unchanged. Cached outputs double as the hand-off between
+processes, so large frames never pass through the parent.
+"""
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from server.utils.profile_utils import profile_call
+
+logger = logging.getLogger(__name__)
+
+# Bump to invalidate every cached stage (e.g. after a pandas upgrade changes outputs)
+CACHE_FORMAT_VERSION = 1
+
+class Stage(NamedTuple):
+    """One pipeline step: fn(*file_paths, *upstream_outputs) -> (output, report)"""
+    name: str
+    fn: Callable[..., Tuple[Any, Dict[str, Any]]]
+    deps: Sequence[str] = ()
+    files: Sequence[str] = ()
+    # Modules (or config file paths) whose source is part of the stage's code version
+    code: Sequence[str] = ()
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def code_version(stage: Stage) -> str:
+    """Hash of the source of the stage function's module and its declared code modules/files"""
+    digest = hashlib.sha256(f"{CACHE_FORMAT_VERSION}:{stage.fn.__module__}.{stage.fn.__qualname__}".encode())
+    for name in sorted({stage.fn.__module__, *stage.code}):
+        if os.path.isfile(name):
+            digest.update(file_digest(name).encode())
+            continue
+        module = sys.modules.get(name) or __import__(name, fromlist=['_'])
+        with open(module.__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def _toposort(stages: List[Stage]) -> List[Stage]:
+    by_name = {stage.name: stage for stage in stages}
+    ordered, done, visiting = [], set(), set()
+
+    def visit(stage: Stage):
+        if stage.name in done:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Pipeline stage cycle at '{stage.name}'")
+        visiting.add(stage.name)
+        for dep in stage.deps:
+            if dep not in by_name:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+            visit(by_name[dep])
+        visiting.discard(stage.name)
+        done.add(stage.name)
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+def load_output(path: str) -> Any:
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def _execute(fn: Callable, file_paths: List[str], dep_paths: List[str], out_path: str,
+             profile_name: Optional[str] = None, trace_memory: bool = False) -> Tuple[Dict[str, Any], float, Optional[Dict[str, Any]]]:
+    """Worker side: load upstream outputs, run the stage (profiled if profile_name is given), store its output"""
+    start = time.perf_counter()
+    inputs = [*file_paths, *[load_output(path) for path in dep_paths]]
+    profile = None
+    if profile_name:
+        (output, report), profile = profile_call(profile_name, fn, *inputs, trace_memory=trace_memory)
+    else:
+        output, report = fn(*inputs)
+    with open(out_path + '.tmp', 'wb') as f:
+        pickle.dump(output, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(out_path + '.tmp', out_path)
+    return report, time.perf_counter() - start, profile
+
+class StageRun(NamedTuple):
+    path: str
+    report: Dict[str, Any]
+    cached: bool
+    seconds: float
+    # Set for stages run with profiling (see profile_utils.profile_call)
+    profile: Optional[Dict[str, Any]] = None
+
+def run_stages(stages: List[Stage], base_dir: str, cache_dir: str, max_workers: Optional[int] = None,
+               use_cache: bool = True, profile: bool = False, trace_memory: bool = False) -> Dict[str, StageRun]:
+    """
+    Run the stage graph and return, per stage, the path of its cached output,
+    its report and whether it was served from cache. File paths in
+    Stage.files are relative to base_dir. With profile, stages that run
+    also return their time/memory profile.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    stages = _toposort(stages)
+
+    # Keys chain through the graph: a changed input file re-runs everything downstream of it
+    keys: Dict[str, str] = {}
+    for stage in stages:
+        digest = hashlib.sha256(stage.name.encode())
+        digest.update(code_version(stage).encode())
+        for rel_path in stage.files:
+            digest.update(file_digest(os.path.join(base_dir, rel_path)).encode())
+        for dep in stage.deps:
+            digest.update(keys[dep].encode())
+        keys[stage.name] = digest.hexdigest()[:16]
+
+    def out_path(stage: Stage) -> str:
+        return os.path.join(cache_dir, f"{stage.name}-{keys[stage.name]}.pkl")
+
+    results: Dict[str, StageRun] = {}
+    pending = []
+    for stage in stages:
+        path = out_path(stage)
+        report_path = path[:-len('.pkl')] + '.json'
+        if use_cache and os.path.exists(path) and os.path.exists(report_path):
+            with open(report_path, 'r') as f:
+                results[stage.name] = StageRun(path, json.load(f), True, 0.0)
+            logger.info(f"  ✓ {stage.name}: cached ({keys[stage.name]})")
+        else:
+            pending.append(stage)
+
+    if pending:
+        workers = max_workers or min(len(pending), os.cpu_count() or 1)
+        # spawn: pandas/pyarrow may already run threads in this process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            running = {}
+            while pending or running:
+                for stage in [s for s in pending if all(dep in results for dep in s.deps)]:
+                    pending.remove(stage)
+                    future = pool.submit(
+                        _execute, stage.fn,
+                        [os.path.join(base_dir, rel_path) for rel_path in stage.files],
+                        [results[dep].path for dep in stage.deps],
+                        out_path(stage),
+                        stage.name if profile else None,
+                        trace_memory,
+                    )
+                    running[future] = stage
+                if not running:
+                    raise RuntimeError(f"Unschedulable pipeline stages: {[s.name for s in pending]}")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    report, seconds, stage_profile = future.result()
+                    path = out_path(stage)
+                    with open(path[:-len('.pkl')] + '.json', 'w') as f:
+                        json.dump(report, f, default=str)
+                    results[stage.name] = StageRun(path, report, False, seconds, stage_profile)
+                    logger.info(f"  ✓ {stage.name}: {seconds:.2f}s")
+
+    _prune(cache_dir, {os.path.basename(out_path(stage))[:-len('.pkl')] for stage in stages},
+           {stage.name for stage in stages})
+    return results
+
+def _prune(cache_dir: str, live: set, names: set) -> None:
+    """Drop superseded cache entries of these stages"""
+    for filename in os.listdir(cache_dir):
+        stem, ext = os.path.splitext(filename)
+        stage_name = stem.rsplit('-', 1)[0]
+        if ext in ('.pkl', '.json') and stage_name in names and stem not in live:
+            os.remove(os.path.join(cache_dir, filename))
@@ -0,0 +1,142 @@
+"""
+Persistent LLM response cache backed by SQLite.
+
+Responses are keyed by a hash of (model, prompt template version, context,
+normalized question) so identical dashboard context + question pairs are
+answered without a Gemini round trip, across restarts and gunicorn workers.
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a user question"""
+    return re.sub(r"\s+", " ", question or "").strip().lower()
+
+def make_cache_key(model: str, prompt_version: str, context: str, question: str = "") -> str:
+    payload = json.dumps([model, prompt_version, context, normalize_question(question)])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class LLMResponseCache:
+    """TTL- and size-bounded response cache in a SQLite file"""
+
+    def __init__(self, path: str, ttl_seconds: int = 86400, max_entries: int = 1000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Set when the cache file can't be created; every lookup is then a miss
+        self.disabled = False
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._connect() as conn:
+                # WAL lets several gunicorn workers read while one writes
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS llm_responses (
+                        key TEXT PRIMARY KEY,
+                        response TEXT NOT NULL,
+                        created_at REAL NOT NULL,
+                        accessed_at REAL NOT NULL
+                    )
+                """)
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_responses_accessed ON llm_responses (accessed_at)")
+        except (OSError, sqlite3.Error) as e:
+            # An unwritable cache location must not keep the app from starting
+            logger.warning(f"⚠ LLM cache disabled, cannot open {path}: {e}")
+            self.disabled = True
+
+    @contextmanager
+    def _connect(self):
+        """Connection per operation (safe across threads); commits on success, always closes"""
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Any]:
+        if self.disabled:
+            with self._lock:
+                self.misses += 1
+            return None
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT response, created_at FROM llm_responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or now - row[1] > self.ttl_seconds:
+                    if row is not None:
+                        conn.execute("DELETE FROM llm_responses WHERE key = ?", (key,))
+                    with self._lock:
+                        self.misses += 1
+                    return None
+                conn.execute("UPDATE llm_responses SET accessed_at = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            # A broken cache must never break the chat endpoint
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, response: Any) -> None:
+        if self.disabled:
+            return
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_responses (key, response, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(response), now, now)
+                )
+                conn.execute("DELETE FROM llm_responses WHERE created_at < ?", (now - self.ttl_seconds,))
+                # Least recently used entries beyond the size bound
+                conn.execute("""
+                    DELETE FROM llm_responses WHERE key IN (
+                        SELECT key FROM llm_responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def clear(self) -> None:
+        if self.disabled:
+            return
+        with self._connect() as conn:
+            conn.execute("DELETE FROM llm_responses")
+
+    def stats(self) -> Dict[str, Any]:
+        size = None
+        if not self.disabled:
+            try:
+                with self._connect() as conn:
+                    size = conn.execute("SELECT COUNT(*) FROM llm_responses").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "disabled": self.disabled,
+                "size": size,
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
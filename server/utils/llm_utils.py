@@ -3,15 +3,18 @@ Centralized LLM utility using Google GenAI SDK
 """
 import os
 import logging
-from typing import Optional
-from google import genai
+from typing import TYPE_CHECKING, Optional
 from dotenv import load_dotenv
 from pathlib import Path
+from server.utils.llm_cache import LLMResponseCache
 
 # Load environment variables
 env_path = Path(__file__).parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
+if TYPE_CHECKING:
+    from google import genai
+
 logger = logging.getLogger(__name__)
 
 class LLMConfig:
@@ -21,17 +24,41 @@ class LLMConfig:
     # Using the user-requested model or a logical default
     MODEL_NAME = "gemini-2.5-flash" 
 
-def get_llm_client() -> genai.Client:
+    # Persistent response cache (kept outside data/processed so it doesn't change the dataset version)
+    CACHE_PATH = os.getenv("LLM_CACHE_PATH", str(Path(__file__).parent.parent / 'data' / 'cache' / 'llm_cache.sqlite3'))
+    CACHE_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+    CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1000"))
+
+    # Upper bound on the estimated tokens of the dashboard context embedded in each prompt
+    CONTEXT_TOKEN_BUDGET = int(os.getenv("LLM_CONTEXT_TOKEN_BUDGET", "1500"))
+
+def llm_configured() -> bool:
+    return bool(LLMConfig.API_KEY)
+
+def get_llm_client() -> "genai.Client":
     """
     Get a configured Google GenAI Client
     """
     if not LLMConfig.API_KEY:
          raise ValueError("GEMINI_API_KEY (or GOOGLE_API_KEY) is not set env")
 
+    # The SDK takes ~0.7s to import; only pay for it once the LLM is actually used
+    from google import genai
+
     # If it happens to be an OpenRouter key starting with sk-or, this client won't work well
     # But user explicit asked for "switch from openrouter to gemini simple"
     
     masked_key = LLMConfig.API_KEY[:6] + "..." + LLMConfig.API_KEY[-4:]
     logger.info(f"Initialized Google GenAI Client with key: {masked_key}")
 
-    return genai.Client(api_key=LLMConfig.API_KEY)
\ No newline at end of file
+    return genai.Client(api_key=LLMConfig.API_KEY)
+
+def get_llm_cache() -> LLMResponseCache:
+    """
+    Get the shared persistent LLM response cache
+    """
+    return LLMResponseCache(
+        LLMConfig.CACHE_PATH,
+        ttl_seconds=LLMConfig.CACHE_TTL_SECONDS,
+        max_entries=LLMConfig.CACHE_MAX_ENTRIES
+    )
\ No newline at end of file
@@ -0,0 +1,182 @@
+"""
+Per-stage profiling for the data pipeline (run_pipeline --profile).
+
+Each profiled call records wall and CPU time, the peak RSS of the process
+while it ran (sampled) and rows and bytes of its inputs and outputs.
+Optionally it also records the tracemalloc peak of Python/numpy allocations;
+that can slow Python-heavy stages (e.g. CSV writing) several times over, so
+wall times of a traced run are not representative.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import resource
+import threading
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FILE = 'pipeline_profile.json'
+
+# RSS sampling interval while a stage runs
+SAMPLE_SECONDS = 0.01
+
+MB = 1024 * 1024
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes (Linux), else None"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def max_rss() -> int:
+    """High-water RSS of this process in bytes"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+class RSSSampler:
+    """Peak RSS over a block, sampled on a background thread"""
+
+    def __init__(self, interval: float = SAMPLE_SECONDS):
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            rss = current_rss()
+            if rss is not None and rss > self.peak:
+                self.peak = rss
+
+    def __enter__(self):
+        if self.peak is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.peak is None:
+            # No /proc: the process high-water mark is the best we have
+            self.peak = max_rss()
+            return
+        self._stop.set()
+        self._thread.join()
+        rss = current_rss()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+def data_size(obj: Any) -> Tuple[Optional[int], Optional[int]]:
+    """(rows, bytes) of a DataFrame/Series, a raw file path, or a tuple/list of those"""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj), int(obj.memory_usage(deep=True).sum() if isinstance(obj, pd.DataFrame) else obj.memory_usage(deep=True))
+    if isinstance(obj, str) and os.path.isfile(obj):
+        return None, os.path.getsize(obj)
+    if isinstance(obj, (tuple, list)):
+        rows, nbytes = None, None
+        for item in obj:
+            item_rows, item_bytes = data_size(item)
+            if item_rows is not None:
+                rows = (rows or 0) + item_rows
+            if item_bytes is not None:
+                nbytes = (nbytes or 0) + item_bytes
+        return rows, nbytes
+    return None, None
+
+def profile_call(name: str, fn: Callable, *args, trace_memory: bool = False, **kwargs) -> Tuple[Any, Dict[str, Any]]:
+    """Run fn(*args, **kwargs) and return (result, profile)"""
+    rows_in, bytes_in = data_size(list(args) + list(kwargs.values()))
+
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif trace_memory:
+        tracemalloc.reset_peak()
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        with RSSSampler() as rss:
+            result = fn(*args, **kwargs)
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        traced_peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    # Stage functions return (output, report); size the output only
+    output = result[0] if isinstance(result, tuple) and len(result) == 2 and isinstance(result[1], dict) else result
+    rows_out, bytes_out = data_size(output)
+    return result, {
+        'stage': name,
+        'wall_s': round(wall, 3),
+        'cpu_s': round(cpu, 3),
+        'peak_rss_mb': round(rss.peak / MB, 1) if rss.peak is not None else None,
+        'tracemalloc_peak_mb': round(traced_peak / MB, 1) if traced_peak is not None else None,
+        'rows_in': rows_in,
+        'rows_out': rows_out,
+        'bytes_in': bytes_in,
+        'bytes_out': bytes_out,
+    }
+
+class PipelineProfiler:
+    """Collects stage profiles for one pipeline run; a pass-through when disabled"""
+
+    def __init__(self, enabled: bool = False, trace_memory: bool = False):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.stages: List[Dict[str, Any]] = []
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self._start = time.perf_counter()
+
+    def measure(self, name: str, fn: Callable, *args, **kwargs) -> Any:
+        if not self.enabled:
+            return fn(*args, **kwargs)
+        result, profile = profile_call(name, fn, *args, trace_memory=self.trace_memory, **kwargs)
+        self.add(profile)
+        return result
+
+    def add(self, profile: Dict[str, Any]) -> None:
+        self.stages.append(profile)
+
+    def write(self, processed_dir: str, mode: str) -> Optional[str]:
+        """Write pipeline_profile.json and log a summary table"""
+        if not self.enabled:
+            return None
+        report = {
+            'mode': mode,
+            'started_at': self.started_at,
+            'total_wall_s': round(time.perf_counter() - self._start, 3),
+            'cpu_count': os.cpu_count(),
+            'trace_memory': self.trace_memory,
+            'stages': self.stages,
+        }
+        path = os.path.join(processed_dir, PROFILE_FILE)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=4)
+        log_profile(report)
+        return path
+
+def _fmt(value: Optional[float], spec: str) -> str:
+    return '-' if value is None else format(value, spec)
+
+def log_profile(report: Dict[str, Any]) -> None:
+    logger.info(f"  ✓ Pipeline profile ({report['mode']}): {report['total_wall_s']:.2f}s total")
+    for stage in report['stages']:
+        if stage.get('cached'):
+            logger.info(f"    {stage['stage']:<24} cached")
+            continue
+        mb_in = stage['bytes_in'] / MB if stage['bytes_in'] is not None else None
+        mb_out = stage['bytes_out'] / MB if stage['bytes_out'] is not None else None
+        logger.info(
+            f"    {stage['stage']:<24} wall {stage['wall_s']:>7.2f}s  cpu {stage['cpu_s']:>7.2f}s  "
+            f"rss {_fmt(stage['peak_rss_mb'], '>7.1f')} MB  traced {_fmt(stage['tracemalloc_peak_mb'], '>7.1f')} MB  "
+            f"rows {_fmt(stage['rows_in'], '>9,')} -> {_fmt(stage['rows_out'], '>9,')}  "
+            f"MB {_fmt(mb_in, '>7.1f')} -> {_fmt(mb_out, '>7.1f')}"
+        )
@@ -0,0 +1,184 @@
+"""
+Typed schemas for the raw CSV exports, applied at read time.
+
+Each raw table states the columns the pipeline uses, their dtypes and its
+date columns, so the CSV is parsed once by the pyarrow engine into the
+right types and the cleaner does not re-coerce them. Files that don't fit
+their schema (dirty values in a numeric column) fall back to an untyped read
+plus the old coercions. read_raw_chunks does the same for tables streamed
+in chunks.
+"""
+import os
+import logging
+from typing import Any, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Resolution pd.to_datetime gives parsed strings; pyarrow's reader would give seconds
+DATE_DTYPE = 'datetime64[us]'
+
+# Table -> columns read (dtype per column) and columns parsed as timestamps.
+# Nullable integer columns are float64, matching what an untyped read infers.
+RAW_SCHEMAS = {
+    'website_sessions': {
+        'dtypes': {
+            'website_session_id': 'int64',
+            'user_id': 'int64',
+            'is_repeat_session': 'int64',
+            'utm_source': 'str',
+            'utm_campaign': 'str',
+            'utm_content': 'str',
+            'device_type': 'str',
+            'http_referer': 'str',
+            # Not in the current exports; the bot filter uses it when present
+            'session_duration': 'float64',
+        },
+        'dates': ['created_at'],
+    },
+    'website_pageviews': {
+        'dtypes': {
+            'website_pageview_id': 'int64',
+            'website_session_id': 'int64',
+            'pageview_url': 'str',
+        },
+        'dates': ['created_at'],
+    },
+    'orders': {
+        'dtypes': {
+            'order_id': 'int64',
+            'website_session_id': 'int64',
+            'user_id': 'float64',
+            'primary_product_id': 'int64',
+            'items_purchased': 'int64',
+            'price_usd': 'float64',
+            'cogs_usd': 'float64',
+        },
+        'dates': ['created_at'],
+    },
+    'order_items': {
+        'dtypes': {
+            'order_item_id': 'int64',
+            'order_id': 'int64',
+            'product_id': 'int64',
+            'is_primary_item': 'int64',
+            'price_usd': 'float64',
+            'cogs_usd': 'float64',
+        },
+        'dates': ['created_at'],
+    },
+    'order_item_refunds': {
+        'dtypes': {
+            'order_item_refund_id': 'int64',
+            'order_item_id': 'int64',
+            'order_id': 'int64',
+            'refund_amount_usd': 'float64',
+        },
+        'dates': ['created_at'],
+    },
+    'products': {
+        'dtypes': {
+            'product_id': 'int64',
+            'product_name': 'str',
+        },
+        'dates': ['created_at'],
+    },
+}
+
+def table_name(path: str) -> str:
+    """Raw table name of a CSV path (website_sessions.csv -> website_sessions)"""
+    return os.path.splitext(os.path.basename(path))[0]
+
+def ensure_datetime(series: pd.Series, errors: str = 'raise') -> pd.Series:
+    """Series as datetime64, parsing only if it wasn't typed at read time"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    return pd.to_datetime(series, errors=errors)
+
+def ensure_numeric(series: pd.Series) -> pd.Series:
+    """Series as numbers (unparseable values -> NaN), parsing only if it wasn't typed at read time"""
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    return pd.to_numeric(series, errors='coerce')
+
+def _coerce(df: pd.DataFrame, schema: Dict[str, Any]) -> pd.DataFrame:
+    """Untyped fallback: coerce what can be coerced, leave the rest as read"""
+    for column, dtype in schema['dtypes'].items():
+        if column in df.columns and dtype != 'str':
+            df[column] = ensure_numeric(df[column])
+    for column in schema['dates']:
+        if column in df.columns:
+            df[column] = ensure_datetime(df[column], errors='coerce')
+    return df
+
+def _date_dtype(df: pd.DataFrame, schema: Dict[str, Any]) -> pd.DataFrame:
+    for column in schema['dates']:
+        if column in df.columns and pd.api.types.is_datetime64_any_dtype(df[column]):
+            df[column] = df[column].astype(DATE_DTYPE)
+    return df
+
+def read_raw(source: Any, table: Optional[str] = None) -> pd.DataFrame:
+    """
+    Read a raw CSV (path or buffer, with its header line) using its table's
+    schema. Tables without a schema are read untyped.
+    """
+    table = table or (table_name(source) if isinstance(source, str) else None)
+    schema = RAW_SCHEMAS.get(table)
+    if schema is None:
+        return pd.read_csv(source)
+
+    start = source.tell() if hasattr(source, 'tell') else None
+    header = pd.read_csv(source, nrows=0).columns.tolist()
+    if start is not None:
+        source.seek(start)
+    usecols = [c for c in header if c in schema['dtypes'] or c in schema['dates']]
+
+    try:
+        df = pd.read_csv(
+            source,
+            usecols=usecols,
+            dtype={c: dtype for c, dtype in schema['dtypes'].items() if c in usecols},
+            parse_dates=[c for c in schema['dates'] if c in usecols],
+            engine='pyarrow',
+        )
+    except (ValueError, TypeError) as e:
+        logger.warning(f"  ⚠ {table} does not match its raw schema ({e}); reading untyped")
+        if start is not None:
+            source.seek(start)
+        return _coerce(pd.read_csv(source, usecols=usecols), schema)
+
+    return _date_dtype(df, schema)
+
+def read_raw_chunks(path: str, chunksize: int, columns: Optional[List[str]] = None,
+                    table: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    """
+    read_raw in chunks of `chunksize` rows, optionally limited to `columns`.
+    pyarrow's reader can't stream, so chunks come from the C parser with the
+    schema dtypes; from the first chunk that doesn't fit them, the rest of
+    the file is read untyped and coerced.
+    """
+    schema = RAW_SCHEMAS[table or table_name(path)]
+    header = pd.read_csv(path, nrows=0).columns.tolist()
+    usecols = [c for c in header if (c in schema['dtypes'] or c in schema['dates'])
+               and (columns is None or c in columns)]
+
+    rows = 0
+    try:
+        for chunk in pd.read_csv(
+            path,
+            usecols=usecols,
+            dtype={c: dtype for c, dtype in schema['dtypes'].items() if c in usecols},
+            parse_dates=[c for c in schema['dates'] if c in usecols],
+            chunksize=chunksize,
+        ):
+            rows += len(chunk)
+            yield _date_dtype(chunk, schema)
+        return
+    except (ValueError, TypeError) as e:
+        logger.warning(f"  ⚠ {os.path.basename(path)} does not match its raw schema after row {rows} ({e}); "
+                       f"reading the rest untyped")
+
+    # Skip the rows already yielded (line 0 is the header); a callable keeps memory flat
+    for chunk in pd.read_csv(path, usecols=usecols, skiprows=lambda line: 0 < line <= rows, chunksize=chunksize):
+        yield _coerce(chunk, schema)
@@ -0,0 +1,155 @@
+"""
+Rule tables for classifying pageview URLs into funnel steps and sessions
+into traffic channels.
+
+Rules are evaluated once per distinct value (a URL, or a source/campaign
+pair): the columns are factorized, the small table of uniques is classified,
+and the results are broadcast back to every row with integer indexing.
+"""
+import os
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Funnel step columns every classification produces, in output order
+FUNNEL_STEPS = ['step_home', 'step_product', 'step_cart', 'step_shipping', 'step_billing', 'step_thankyou']
+
+# A URL is in a step if any of the step's rules match
+DEFAULT_FUNNEL_RULES = [
+    {'step': 'step_home', 'match': 'equals', 'value': '/home'},
+    # Generic products list + item pages count as "Product Browsing"
+    {'step': 'step_product', 'match': 'contains', 'value': '/the-original-mr-fuzzy'},
+    {'step': 'step_product', 'match': 'contains', 'value': '/products'},
+    {'step': 'step_cart', 'match': 'equals', 'value': '/cart'},
+    {'step': 'step_shipping', 'match': 'equals', 'value': '/shipping'},
+    {'step': 'step_billing', 'match': 'equals', 'value': '/billing'},
+    {'step': 'step_thankyou', 'match': 'equals', 'value': '/thank-you-for-your-order'},
+]
+
+# Optional JSON file (a list of rules like the above) replacing the defaults
+FUNNEL_RULES_ENV = 'BEARCART_FUNNEL_RULES'
+
+# First matching rule wins. A rule matches when each condition it lists matches
+# any of its values on the lowercased traffic_source / utm_campaign.
+DEFAULT_CHANNEL_RULES = [
+    {'channel': 'Direct', 'source': {'match': 'equals', 'values': ['direct']}},
+    {'channel': 'Paid Search', 'source': {'match': 'contains', 'values': ['gsearch', 'bsearch']},
+     'campaign': {'match': 'contains', 'values': ['nonbrand', 'brand']}},
+    # Search without a campaign (approximation)
+    {'channel': 'Organic Search', 'source': {'match': 'contains', 'values': ['gsearch', 'bsearch']}},
+    {'channel': 'Social', 'source': {'match': 'contains', 'values': ['social']}},
+]
+
+# Channel of sessions no rule matches (a rule without conditions overrides it)
+DEFAULT_CHANNEL = 'Other'
+
+# Optional JSON file (a list of rules like the above) replacing the defaults
+CHANNEL_RULES_ENV = 'BEARCART_CHANNEL_RULES'
+
+CHANNEL_CONDITIONS = {'source': 'traffic_source', 'campaign': 'utm_campaign'}
+
+MATCHERS = {
+    'equals': lambda urls, value: urls == value,
+    'prefix': lambda urls, value: urls.str.startswith(value),
+    'contains': lambda urls, value: urls.str.contains(value, regex=False),
+    'regex': lambda urls, value: urls.str.contains(value, regex=True),
+}
+
+def validate_rules(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for rule in rules:
+        if rule.get('match') not in MATCHERS:
+            raise ValueError(f"Unknown URL rule match '{rule.get('match')}' (expected one of {sorted(MATCHERS)})")
+        if not rule.get('step') or not isinstance(rule.get('value'), str):
+            raise ValueError(f"URL rule needs a step and a string value: {rule}")
+    return rules
+
+def validate_channel_rules(rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    for rule in rules:
+        if not rule.get('channel'):
+            raise ValueError(f"Channel rule needs a channel: {rule}")
+        for key in set(rule) - {'channel'}:
+            condition = rule[key]
+            if key not in CHANNEL_CONDITIONS:
+                raise ValueError(f"Unknown channel rule condition '{key}' (expected one of {sorted(CHANNEL_CONDITIONS)})")
+            if condition.get('match') not in MATCHERS:
+                raise ValueError(f"Unknown channel rule match '{condition.get('match')}' (expected one of {sorted(MATCHERS)})")
+            if not condition.get('values') or not all(isinstance(v, str) for v in condition['values']):
+                raise ValueError(f"Channel rule condition needs a list of string values: {rule}")
+    return rules
+
+def funnel_rules_path() -> Optional[str]:
+    return os.getenv(FUNNEL_RULES_ENV) or None
+
+def channel_rules_path() -> Optional[str]:
+    return os.getenv(CHANNEL_RULES_ENV) or None
+
+def _load_rules(path: Optional[str], default: List[Dict[str, Any]], validate, kind: str) -> List[Dict[str, Any]]:
+    if not path:
+        return default
+    with open(path, 'r') as f:
+        rules = validate(json.load(f))
+    logger.info(f"  ✓ Loaded {len(rules)} {kind} rules from {path}")
+    return rules
+
+def load_funnel_rules(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Rules from a JSON file (default: $BEARCART_FUNNEL_RULES), else the built-in table"""
+    return _load_rules(path or funnel_rules_path(), DEFAULT_FUNNEL_RULES, validate_rules, 'funnel')
+
+def load_channel_rules(path: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Rules from a JSON file (default: $BEARCART_CHANNEL_RULES), else the built-in table"""
+    return _load_rules(path or channel_rules_path(), DEFAULT_CHANNEL_RULES, validate_channel_rules, 'channel')
+
+def rule_steps(rules: List[Dict[str, Any]]) -> List[str]:
+    """Standard funnel steps first, then any extra steps the rules define"""
+    extra = [rule['step'] for rule in rules if rule['step'] not in FUNNEL_STEPS]
+    return FUNNEL_STEPS + list(dict.fromkeys(extra))
+
+def classify_urls(urls: pd.Series, rules: List[Dict[str, Any]]) -> Dict[str, np.ndarray]:
+    """Step -> int8 0/1 flag per row of urls (missing URLs match nothing)"""
+    codes, uniques = pd.factorize(urls)
+    uniques = pd.Series(uniques, dtype=object)
+    steps = rule_steps(rules)
+
+    # One row per distinct URL plus a trailing all-zero row that code -1 (NaN) indexes
+    table = np.zeros((len(uniques) + 1, len(steps)), dtype=np.int8)
+    for rule in rules:
+        matched = MATCHERS[rule['match']](uniques, rule['value']).to_numpy(dtype=bool, na_value=False)
+        table[:-1, steps.index(rule['step'])] |= matched
+
+    return {step: table[:, j][codes] for j, step in enumerate(steps)}
+
+def classify_channels(df: pd.DataFrame, rules: List[Dict[str, Any]], default: str = DEFAULT_CHANNEL) -> pd.Series:
+    """Traffic channel per row of df from its traffic_source/utm_campaign columns"""
+    # Missing columns and values compare as their str() like the old row-wise logic ('' / 'nan')
+    codes, uniques = {}, {}
+    for key, column in CHANNEL_CONDITIONS.items():
+        values = df[column] if column in df.columns else pd.Series('', index=df.index)
+        codes[key], uniques[key] = pd.factorize(values, use_na_sentinel=False)
+
+    # Distinct (source, campaign) pairs actually present
+    pair_codes, pairs = pd.factorize(codes['source'].astype(np.int64) * len(uniques['campaign']) + codes['campaign'])
+    lowered = {
+        'source': pd.Series([str(v).lower() for v in uniques['source']], dtype=object)[pairs // len(uniques['campaign'])],
+        'campaign': pd.Series([str(v).lower() for v in uniques['campaign']], dtype=object)[pairs % len(uniques['campaign'])],
+    }
+
+    conditions = []
+    for rule in rules:
+        matched = np.ones(len(pairs), dtype=bool)
+        for key in CHANNEL_CONDITIONS:
+            if key in rule:
+                values = lowered[key].reset_index(drop=True)
+                any_value = np.zeros(len(pairs), dtype=bool)
+                for value in rule[key]['values']:
+                    any_value |= MATCHERS[rule[key]['match']](values, value).to_numpy(dtype=bool, na_value=False)
+                matched &= any_value
+        conditions.append(matched)
+
+    channels = np.array([rule['channel'] for rule in rules] + [default], dtype=object)
+    choice = np.select(conditions, np.arange(len(rules)), default=len(rules)) if rules else np.full(len(pairs), 0)
+    return pd.Series(channels[choice][pair_codes], index=df.index, name='traffic_channel')
@@ -0,0 +1,126 @@
+"""
+Compact dtype schema for the session-level master dataset
+"""
+import logging
+from typing import Any, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Column -> kind:
+#   category: dictionary-encoded string
+#   counter:  smallest signed integer type that holds the observed range
+#   flag:     0/1 indicator stored in one byte
+#   bool:     boolean stored in one byte
+# Columns not listed (money, risk scores, timestamps) keep their dtype.
+MASTER_SCHEMA = {
+    'traffic_source': 'category',
+    'utm_campaign': 'category',
+    'utm_content': 'category',
+    'device_type': 'category',
+    'http_referer': 'category',
+    'traffic_channel': 'category',
+    'customer_segment': 'category',
+    'day_of_week': 'category',
+
+    'session_id': 'counter',
+    'user_id': 'counter',
+    'orders_in_session': 'counter',
+    'total_pageviews': 'counter',
+    'hour_of_day': 'counter',
+
+    'is_repeat_session': 'flag',
+    'conversion_flag': 'flag',
+    'was_refunded': 'flag',
+    'is_weekend': 'flag',
+    'step_home': 'flag',
+    'step_product': 'flag',
+    'step_cart': 'flag',
+    'step_shipping': 'flag',
+    'step_billing': 'flag',
+    'step_thankyou': 'flag',
+
+    'converted': 'bool',
+}
+
+INT_TYPES = [np.int8, np.int16, np.int32, np.int64]
+
+def _counter_dtype(series: pd.Series):
+    """Smallest integer dtype for the series, or None if it holds non-integral values"""
+    if series.isna().any():
+        return None
+    if pd.api.types.is_float_dtype(series) and not (series % 1 == 0).all():
+        return None
+    if not (pd.api.types.is_integer_dtype(series) or pd.api.types.is_float_dtype(series)):
+        return None
+    if series.empty:
+        return np.dtype(np.int8)
+    lo, hi = series.min(), series.max()
+    for int_type in INT_TYPES:
+        info = np.iinfo(int_type)
+        if info.min <= lo and hi <= info.max:
+            return np.dtype(int_type)
+    return None
+
+def _target_dtype(series: pd.Series, kind: str):
+    if kind == 'category':
+        return 'category'
+    if kind == 'counter':
+        return _counter_dtype(series)
+    if kind == 'flag':
+        return np.dtype(np.int8)
+    if kind == 'bool':
+        return np.dtype(bool)
+    raise ValueError(f"Unknown schema kind: {kind}")
+
+def apply_schema(df: pd.DataFrame, schema: Dict[str, str] = MASTER_SCHEMA) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Cast columns to their compact dtypes. Columns already in the target dtype
+    are left untouched (no copy), so memory-mapped frames stay shared.
+    Returns the frame and a per-column memory report in bytes.
+    """
+    before = df.memory_usage(deep=True, index=False)
+    casts = {}
+    for col, kind in schema.items():
+        if col not in df.columns:
+            continue
+        series = df[col]
+        target = _target_dtype(series, kind)
+        if target is None:
+            continue
+        if target == 'category':
+            if isinstance(series.dtype, pd.CategoricalDtype):
+                continue
+            casts[col] = series.astype('category')
+        elif series.dtype != target:
+            if kind == 'flag':
+                series = series.fillna(0)
+            casts[col] = series.astype(target)
+
+    if casts:
+        df = df.assign(**casts)
+    after = df.memory_usage(deep=True, index=False)
+
+    report = {
+        'columns': {
+            col: {
+                'dtype': str(df[col].dtype),
+                'bytes_before': int(before[col]),
+                'bytes_after': int(after[col]),
+            }
+            for col in df.columns
+        },
+        'total_bytes_before': int(before.sum()),
+        'total_bytes_after': int(after.sum()),
+    }
+    return df, report
+
+def log_memory_report(report: Dict[str, Any], label: str = 'master dataset') -> None:
+    before_mb = report['total_bytes_before'] / 1e6
+    after_mb = report['total_bytes_after'] / 1e6
+    logger.info(f"  ✓ Schema applied to {label}: {before_mb:.1f} MB -> {after_mb:.1f} MB")
+    for col, info in report['columns'].items():
+        if info['bytes_before'] != info['bytes_after']:
+            logger.info(f"    {col:<20} {info['dtype']:<10} {info['bytes_before']:>12,} -> {info['bytes_after']:>12,} bytes")
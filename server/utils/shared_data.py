@@ -0,0 +1,100 @@
+"""
+Read-only dataset snapshots shared by all gunicorn workers.
+
+The gunicorn master loads the processed data once and publishes the frames
+BearCartMetrics needs as single-chunk Arrow IPC files. Workers memory-map
+those files, so their DataFrame columns point into the shared page cache
+instead of private copies and RSS stays flat as workers are added.
+
+Versions produced while the server runs are published by the first worker
+that hot-reloads them. A file lock in the snapshot root orders that: publishing
+(and pruning old versions) holds it exclusively, attaching holds it shared.
+"""
+import os
+import json
+import fcntl
+import shutil
+import logging
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+LOCK_NAME = '.snapshot.lock'
+
+# Snapshot table name -> BearCartMetrics attribute
+SHARED_TABLES = {
+    'master_dataset': 'df_master',
+    'orders_clean': 'df_orders',
+    'items_clean': 'df_items',
+    'refunds_clean': 'df_refunds',
+}
+
+def get_shared_dir() -> Optional[str]:
+    """Snapshot root when shared mode is enabled (BEARCART_SHARED_DATA=1), else None"""
+    if os.getenv("BEARCART_SHARED_DATA", "").lower() not in ("1", "true", "yes"):
+        return None
+    # File-backed by default: /dev/shm is often only 64MB inside containers
+    default_dir = os.path.join(tempfile.gettempdir(), 'bearcart_shared')
+    return os.getenv("BEARCART_SHARED_DIR", default_dir)
+
+def find_snapshot(shared_dir: Optional[str], version: str) -> Optional[str]:
+    """Directory of a complete snapshot for the dataset version, if published"""
+    if not shared_dir or not version:
+        return None
+    snapshot_dir = os.path.join(shared_dir, version)
+    if os.path.exists(os.path.join(snapshot_dir, MANIFEST_NAME)):
+        return snapshot_dir
+    return None
+
+@contextmanager
+def snapshot_lock(shared_dir: str, shared: bool = False) -> Iterator[None]:
+    """Cross-process lock on the snapshot root: exclusive to publish, shared to attach"""
+    os.makedirs(shared_dir, exist_ok=True)
+    with open(os.path.join(shared_dir, LOCK_NAME), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def publish_snapshot(metrics, shared_dir: str) -> str:
+    """
+    Write the loaded frames of a BearCartMetrics instance as a snapshot.
+    The directory is renamed into place only once complete, so workers never
+    attach to a half-written version. Call with snapshot_lock held: older
+    versions are pruned, which must not race a worker attaching to them.
+    """
+    from server.utils.storage_utils import write_table
+
+    version = metrics.dataset_version
+    snapshot_dir = os.path.join(shared_dir, version)
+    if find_snapshot(shared_dir, version):
+        return snapshot_dir
+
+    os.makedirs(shared_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=shared_dir)
+    try:
+        for name, attr in SHARED_TABLES.items():
+            write_table(getattr(metrics, attr), staging_dir, name, formats=('arrow',))
+        with open(os.path.join(staging_dir, MANIFEST_NAME), 'w') as f:
+            json.dump({'dataset_version': version, 'source_dir': metrics.data_dir}, f, indent=4)
+        os.rename(staging_dir, snapshot_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    # Older versions are no longer attached by new workers (mapped files stay valid once unlinked)
+    for entry in os.listdir(shared_dir):
+        if entry not in (version, LOCK_NAME):
+            shutil.rmtree(os.path.join(shared_dir, entry), ignore_errors=True)
+
+    logger.info(f"Published shared dataset snapshot {version} to {snapshot_dir}")
+    return snapshot_dir
+
+def remove_snapshots(shared_dir: Optional[str]) -> None:
+    if shared_dir and os.path.isdir(shared_dir):
+        shutil.rmtree(shared_dir, ignore_errors=True)
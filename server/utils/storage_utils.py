@@ -0,0 +1,94 @@
+"""
+Columnar (Arrow IPC / Feather) storage for processed datasets with CSV fallback
+"""
+import os
+import logging
+from typing import List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+ARROW_EXT = '.arrow'
+CSV_EXT = '.csv'
+TMP_SUFFIX = '.tmp'
+
+def write_table(df: pd.DataFrame, data_dir: str, name: str, formats=('csv', 'arrow'),
+                appended: Optional[pd.DataFrame] = None) -> None:
+    """
+    Write a processed table as CSV and/or an uncompressed Arrow IPC file.
+    Uncompressed IPC keeps dtypes and can be memory-mapped without decoding.
+
+    Files are written under a temporary name and renamed into place, so
+    readers that have the previous version memory-mapped (the API, or the
+    pipeline itself when merging into existing outputs) keep a valid file.
+    If `appended` holds the rows df gained since the last write, an existing
+    CSV is extended with just those rows instead of being rewritten.
+    """
+    if 'csv' in formats:
+        path = os.path.join(data_dir, name + CSV_EXT)
+        append_csv(df, path, appended)
+    if 'arrow' in formats:
+        # One record batch per file: contiguous columns map straight into numpy without copies
+        path = os.path.join(data_dir, name + ARROW_EXT)
+        table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+        with pa.OSFile(path + TMP_SUFFIX, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table, max_chunksize=None)
+        os.replace(path + TMP_SUFFIX, path)
+
+def append_csv(df: pd.DataFrame, path: str, appended: Optional[pd.DataFrame] = None) -> None:
+    """Write df to a CSV, or only append the `appended` rows when the file already exists"""
+    if appended is not None and os.path.exists(path):
+        appended[df.columns].to_csv(path, mode='a', header=False, index=False)
+        return
+    df.to_csv(path + TMP_SUFFIX, index=False)
+    os.replace(path + TMP_SUFFIX, path)
+
+def find_table(data_dir: str, name: str) -> Optional[str]:
+    """Path of the freshest available artifact for a table, preferring Arrow"""
+    arrow_path = os.path.join(data_dir, name + ARROW_EXT)
+    csv_path = os.path.join(data_dir, name + CSV_EXT)
+
+    if os.path.exists(arrow_path):
+        # A CSV written after the Arrow file means the Arrow copy is stale
+        if not os.path.exists(csv_path) or os.path.getmtime(arrow_path) >= os.path.getmtime(csv_path):
+            return arrow_path
+    if os.path.exists(csv_path):
+        return csv_path
+    return None
+
+def require_table(data_dir: str, name: str) -> str:
+    """Like find_table, but a missing table is an error"""
+    path = find_table(data_dir, name)
+    if path is None:
+        raise FileNotFoundError(f"No {name}{ARROW_EXT} or {name}{CSV_EXT} in {data_dir}")
+    return path
+
+def read_table(path: str, columns: Optional[List[str]] = None,
+               parse_dates: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Read a table, projecting to `columns` (missing ones are ignored).
+    Arrow files are memory-mapped; CSV files use usecols.
+    """
+    if path.endswith(ARROW_EXT):
+        # Buffers of the mapped table point into the file; select() is a zero-copy projection
+        table = pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+        if columns is not None:
+            table = table.select([col for col in columns if col in table.column_names])
+        # split_blocks avoids consolidating columns into fresh 2D blocks, so
+        # single-chunk numeric columns stay views over the mapped file
+        df = table.to_pandas(split_blocks=True)
+    else:
+        usecols = None
+        if columns is not None:
+            wanted = set(columns)
+            usecols = lambda col: col in wanted
+        df = pd.read_csv(path, usecols=usecols)
+
+    # Arrow preserves datetime dtypes; CSV (or legacy string columns) still need parsing
+    for col in parse_dates or []:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    return df
@@ -0,0 +1,149 @@
+"""
+Prometheus instrumentation for the API.
+
+PrometheusMiddleware records per-route request latency, in-flight requests
+and status codes; span() times internal work (dashboard sections, LLM calls,
+PDF renders). render_metrics() serves it all in the Prometheus text format.
+
+Under gunicorn every worker has its own counters, so prometheus_client runs
+in multiprocess mode: gunicorn.conf points PROMETHEUS_MULTIPROC_DIR at an
+empty directory before the workers start, each worker writes its samples to
+files there, and /metrics merges the files of all workers. Without it (a
+single uvicorn process) the in-process registry is served.
+"""
+import os
+import time
+import logging
+from contextlib import contextmanager
+from typing import Iterator
+
+# Must exist before the first metric is created in multiprocess mode
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+
+logger = logging.getLogger(__name__)
+
+# Seconds; LLM calls and cold PDF renders run well past the default 10s top bucket
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Route label of requests no route matched (keeps label cardinality bounded)
+UNMATCHED_ROUTE = '<unmatched>'
+
+METRICS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+REQUEST_LATENCY = Histogram(
+    'bearcart_http_request_duration_seconds', 'HTTP request latency (until the response body is sent)',
+    ['method', 'route'], buckets=LATENCY_BUCKETS,
+)
+REQUESTS = Counter(
+    'bearcart_http_requests_total', 'HTTP requests by response status',
+    ['method', 'route', 'status'],
+)
+IN_FLIGHT = Gauge(
+    'bearcart_http_requests_in_flight', 'HTTP requests being served',
+    ['method'], multiprocess_mode='livesum',
+)
+SPAN_LATENCY = Histogram(
+    'bearcart_span_duration_seconds', 'Duration of internal operations',
+    ['span'], buckets=LATENCY_BUCKETS,
+)
+SPAN_ERRORS = Counter(
+    'bearcart_span_errors_total', 'Internal operations that raised',
+    ['span'],
+)
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Time the block as span `name`, counting it as an error if it raises"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        SPAN_ERRORS.labels(name).inc()
+        raise
+    finally:
+        SPAN_LATENCY.labels(name).observe(time.perf_counter() - start)
+
+class SpanTimer:
+    """One span accumulated over several separate blocks (e.g. each next() on a stream)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.seconds = 0.0
+        self.failed = False
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def record(self) -> None:
+        SPAN_LATENCY.labels(self.name).observe(self.seconds)
+        if self.failed:
+            SPAN_ERRORS.labels(self.name).inc()
+
+def observe(name: str, seconds: float) -> None:
+    """Record a duration measured elsewhere (e.g. time to first streamed token)"""
+    SPAN_LATENCY.labels(name).observe(seconds)
+
+def route_template(scope) -> str:
+    """Path template of the route that served this request (e.g. /api/dashboard)"""
+    # The router records the matched route in the scope it shares with the middleware
+    route = scope.get('route')
+    return getattr(route, 'path', None) or UNMATCHED_ROUTE
+
+class PrometheusMiddleware:
+    """ASGI middleware (not BaseHTTPMiddleware, so streamed responses pass through unbuffered)"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        method = scope['method']
+        # Unhandled exceptions become a 500 further out
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        # The route is only known once the router has matched it, so in-flight is per method
+        in_flight = IN_FLIGHT.labels(method)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = route_template(scope)
+            REQUEST_LATENCY.labels(method, route).observe(time.perf_counter() - start)
+            REQUESTS.labels(method, route, str(status)).inc()
+            in_flight.dec()
+
+def render_metrics() -> bytes:
+    """All metrics in the Prometheus text format (merged across workers in multiprocess mode)"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+def mark_worker_dead(pid: int) -> None:
+    """Drop a dead worker's live gauges (gunicorn child_exit hook)"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,155 @@
+"""
+Per-table high-water marks for incremental pipeline runs.
+
+Raw CSVs are append-only exports. For each table we remember the largest id
+already processed and the byte offset of the last complete line, so the next
+run parses only the appended tail. Rows at or below the id mark are dropped
+even if they show up again.
+
+Child rows whose parent hasn't arrived yet (an item before its order, a
+pageview before its session) are kept under pending/ and retried by the next
+run, since the watermark has already moved past them.
+"""
+import io
+import os
+import json
+import shutil
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+from server.utils.raw_schema_utils import read_raw, table_name
+from server.utils.storage_utils import ARROW_EXT, CSV_EXT, find_table, read_table, write_table
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE = 'pipeline_state.json'
+
+# Subdirectory of the processed dir holding rows to retry on the next run:
+# raw child-table rows, and funnel profiles of pageviews ('funnel_profiles')
+PENDING_DIR = 'pending'
+
+# Raw table -> monotonically increasing id column used as its watermark
+WATERMARK_COLUMNS = {
+    'website_sessions': 'website_session_id',
+    'website_pageviews': 'website_pageview_id',
+    'orders': 'order_id',
+    'order_items': 'order_item_id',
+    'order_item_refunds': 'order_item_refund_id',
+}
+
+def load_state(processed_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(processed_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(processed_dir: str, marks: Dict[str, Dict[str, Any]], mode: str,
+               outputs: Optional[Dict[str, str]] = None) -> None:
+    """Persist watermarks, and for full runs the stage output each processed table was written from"""
+    state = {
+        'mode': mode,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+        'tables': marks,
+    }
+    if outputs is not None:
+        state['outputs'] = outputs
+    path = os.path.join(processed_dir, STATE_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=4)
+    os.replace(path + '.tmp', path)
+
+def load_pending(processed_dir: str, name: str) -> pd.DataFrame:
+    """Rows held back by the previous run (empty if none)"""
+    path = find_table(os.path.join(processed_dir, PENDING_DIR), name)
+    return read_table(path) if path else pd.DataFrame()
+
+def save_pending(processed_dir: str, name: str, df: pd.DataFrame) -> None:
+    """Hold back rows for the next run (replaces what was pending)"""
+    pending_dir = os.path.join(processed_dir, PENDING_DIR)
+    if df.empty:
+        for ext in (ARROW_EXT, CSV_EXT):
+            if os.path.exists(os.path.join(pending_dir, name + ext)):
+                os.remove(os.path.join(pending_dir, name + ext))
+        return
+    os.makedirs(pending_dir, exist_ok=True)
+    write_table(df, pending_dir, name, formats=('arrow',))
+    logger.info(f"  ✓ Holding back {len(df)} {name} rows until their parent rows arrive")
+
+def clear_pending(processed_dir: str) -> None:
+    """Drop everything held back (a full rebuild re-reads every raw row)"""
+    shutil.rmtree(os.path.join(processed_dir, PENDING_DIR), ignore_errors=True)
+
+def complete_size(path: str) -> int:
+    """Bytes up to and including the last newline (a half-written last line is left for the next run)"""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        pos = size
+        while pos > 0:
+            step = min(65536, pos)
+            f.seek(pos - step)
+            block = f.read(step)
+            idx = block.rfind(b'\n')
+            if idx >= 0:
+                return pos - step + idx + 1
+            pos -= step
+    return 0
+
+def read_header(path: str) -> list:
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+def table_mark(path: str, df: Optional[pd.DataFrame], column: str, value: Optional[int] = None) -> Dict[str, Any]:
+    """Watermark after fully processing the table in df (as read from path),
+    or given its max id directly when the table was streamed"""
+    if value is None:
+        value = int(df[column].max()) if len(df) else 0
+    return {
+        'column': column,
+        'value': value,
+        'offset': complete_size(path),
+        'header': read_header(path),
+    }
+
+def read_new_rows(path: str, mark: Optional[Dict[str, Any]], column: str) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """Rows appended to a raw CSV since `mark`, and the mark to store after processing them"""
+    header = read_header(path)
+    end = complete_size(path)
+
+    if mark and mark.get('header') == header and mark['offset'] <= end:
+        with open(path, 'rb') as f:
+            header_line = f.readline()
+            f.seek(mark['offset'])
+            tail = f.read(end - mark['offset'])
+        if tail.strip():
+            # Re-attach the header so the tail is read with the table's typed schema
+            df = read_raw(io.BytesIO(header_line + tail), table_name(path))
+        else:
+            df = pd.DataFrame(columns=header)
+    else:
+        # File was rewritten (or never tracked): fall back to the id mark alone
+        if mark:
+            logger.warning(f"  ⚠ {os.path.basename(path)} changed before the last offset; rescanning")
+        if end < os.path.getsize(path):
+            # Leave the half-written last line for the next run
+            with open(path, 'rb') as f:
+                df = read_raw(io.BytesIO(f.read(end)), table_name(path))
+        else:
+            df = read_raw(path)
+
+    last = mark['value'] if mark else 0
+    seen = df[column] <= last
+    if seen.any():
+        logger.info(f"  ✓ Skipped {int(seen.sum())} already-processed rows in {os.path.basename(path)}")
+        df = df[~seen]
+
+    new_mark = {
+        'column': column,
+        'value': max(last, int(df[column].max())) if len(df) else last,
+        'offset': end,
+        'header': header,
+    }
+    logger.info(f"Loaded {len(df)} new rows from {path}")
+    return df, new_mark